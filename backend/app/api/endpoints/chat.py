@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+from datetime import datetime, timedelta
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks
 import logging
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
@@ -115,7 +117,7 @@ def send_message(
     if not conv:
         return NotFound(message="Conversation not found")
 
-    user_msg, asst_msg = chat_service.non_stream_chat(
+    user_msg, asst_msg, cache_info = chat_service.non_stream_chat(
         db,
         conversation_id=conversation_id,
         user_id=current_user.id,
@@ -127,6 +129,7 @@ def send_message(
         rag_top_k=body.retrieve_top_k,
         rag_use_rerank=body.use_rerank,
         rag_rerank_top_n=body.rerank_top_n,
+        use_answer_cache=body.use_answer_cache,
     )
 
     user_dict = {
@@ -143,8 +146,13 @@ def send_message(
         "tokens_prompt": asst_msg.tokens_prompt,
         "tokens_completion": asst_msg.tokens_completion,
         "latency_ms": asst_msg.latency_ms,
+        "ttft_ms": asst_msg.ttft_ms,
+        "retrieval_ms": asst_msg.retrieval_ms,
+        "tokens_per_second": asst_msg.tokens_per_second,
         "created_at": asst_msg.created_at.isoformat() if asst_msg.created_at else None,
     }
+    if cache_info:
+        assistant_dict["cache"] = cache_info
 
     # 为前端更易用的结构提供别名与数组，便于直接 append 渲染
     data = {
@@ -157,16 +165,13 @@ def send_message(
         # 顺序消息数组，直接用于前端渲染
         "messages": [user_dict, assistant_dict],
     }
-    try:
-        logger.info(
-            "[api.chat] reply_ready conv=%s user_msg=%s asst_msg=%s asst_len=%s",
-            conversation_id,
-            user_msg.id,
-            asst_msg.id,
-            len(assistant_dict.get("content") or ""),
-        )
-    except Exception:
-        pass
+    logger.debug(
+        "[api.chat] reply_ready conv=%s user_msg=%s asst_msg=%s asst_len=%s",
+        conversation_id,
+        user_msg.id,
+        asst_msg.id,
+        len(assistant_dict.get("content") or ""),
+    )
 
     # Auto-generate title in background (only if missing)
     try:
@@ -182,31 +187,36 @@ def send_message(
 
 
 @router.post("/conversations/{conversation_id}/messages/stream")
-def send_message_stream(
+async def send_message_stream(
     conversation_id: int,
     body: MessageCreate,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_mysql_db),
     current_user: models.User = Depends(deps.get_current_user),
 ):
-    conv = crud_chat.get_conversation(db, conversation_id, current_user.id)
+    conv = await run_in_threadpool(crud_chat.get_conversation, db, conversation_id, current_user.id)
     if not conv:
         return NotFound(message="Conversation not found")
+    user_id = current_user.id
+    conv_model = conv.model
+    # hand the request session's connection back to the pool before streaming starts;
+    # the generator opens its own short-lived sessions
+    await run_in_threadpool(db.close)
 
-    gen = chat_service.stream_chat_generator(
-        db,
+    gen = chat_service.astream_chat_generator(
         conversation_id=conversation_id,
-        user_id=current_user.id,
+        user_id=user_id,
         content=body.content,
-        model=body.model or conv.model,
+        model=body.model or conv_model,
         temperature=body.temperature,
         top_p=body.top_p,
         max_tokens=body.max_tokens,
         rag_top_k=body.retrieve_top_k,
         rag_use_rerank=body.use_rerank,
         rag_rerank_top_n=body.rerank_top_n,
+        use_answer_cache=body.use_answer_cache,
     )
-    logger.info("[api.chat] stream_begin conv=%s", conversation_id)
+    logger.debug("[api.chat] stream_begin conv=%s", conversation_id)
     resp = StreamingResponse(gen, media_type="text/event-stream")
     resp.headers["Cache-Control"] = "no-cache"
     resp.headers["Connection"] = "keep-alive"
@@ -217,7 +227,7 @@ def send_message_stream(
         background_tasks.add_task(
             title_service.generate_and_save_if_needed_background,
             conversation_id=conversation_id,
-            user_id=current_user.id,
+            user_id=user_id,
             force=False,
         )
     except Exception:
@@ -225,6 +235,19 @@ def send_message_stream(
     return resp
 
 
+@router.get("/stats/models")
+def model_stats(
+    days: Optional[int] = 30,
+    db: Session = Depends(get_mysql_db),
+    current_user: models.User = Depends(deps.get_current_user),
+):
+    """Latency (total, TTFT, retrieval), throughput and token usage per model."""
+    if days is not None and days < 1:
+        return BadRequest(message="days must be >= 1")
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    return Success(data=crud_chat.get_model_stats(db, current_user.id, since=since))
+
+
 @router.post("/conversations/{conversation_id}/title/auto")
 def auto_generate_title(
     conversation_id: int,
@@ -4,6 +4,7 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, UploadFile, File, Form, BackgroundTasks
 import logging
+import hashlib
 import os
 import pathlib
 import uuid as uuidlib
@@ -15,8 +16,8 @@ from app import models
 from app.schemas.kb import KBCreate, KBUpdate, KBOut, KBListOut
 from app.schemas.kb_document import DocumentCreate, DocumentOut, DocumentListOut
 from app.crud import crud_kb, crud_kb_document
-from app.services.index_service import index_document_background
-from app.services import chroma_client
+from app.services.index_queue import schedule_index
+from app.services import answer_cache, chroma_client, lexical_index
 from app.utils.response import Success, BadRequest, NotFound, Created
 from app.config.settings import settings
 
@@ -184,9 +185,14 @@ def delete_document(
     except Exception:
         logger = logging.getLogger(__name__)
         logger.warning("[kb.delete] chroma_delete_failed kb=%s doc=%s", kb_id, doc_id)
+    try:
+        lexical_index.delete_doc(kb.chroma_collection, doc.uid)
+    except Exception:
+        logging.getLogger(__name__).warning("[kb.delete] lexical_delete_failed kb=%s doc=%s", kb_id, doc_id)
     ok = crud_kb_document.soft_delete_document(db, kb_id, doc_id, current_user.id)
     if not ok:
         return NotFound(message="Document not found")
+    answer_cache.bump_kb_version(kb_id)
     return Success(message="Deleted")
 
 
@@ -206,12 +212,8 @@ def reprocess_document(
     doc = crud_kb_document.get_document(db, kb_id, doc_id, current_user.id)
     if not kb or not doc:
         return NotFound(message="Document not found")
-    # remove old vectors
-    try:
-        chroma_client.delete_by_doc_uid(kb.chroma_collection, doc.uid)
-    except Exception:
-        logger = logging.getLogger(__name__)
-        logger.warning("[kb.reprocess] chroma_delete_failed kb=%s doc=%s", kb_id, doc_id)
+    # old vectors stay in place: the indexer diffs per-chunk hashes and only rewrites
+    # changed chunks and removes ids that no longer exist
 
     # mark processing with new params
     import json as _json
@@ -231,8 +233,7 @@ def reprocess_document(
     )
 
     try:
-        if background_tasks is not None:
-            background_tasks.add_task(index_document_background, kb_id, doc_id, current_user.id)
+        schedule_index(background_tasks, kb_id, doc_id, current_user.id)
     except Exception:
         logger = logging.getLogger(__name__)
         logger.debug("[kb.reprocess] schedule_failed kb=%s doc=%s", kb_id, doc_id)
@@ -284,6 +285,7 @@ def upload_document(
 
     abs_path = os.path.join(storage_dir, filename)
     bytes_written = 0
+    sha256 = hashlib.sha256()
     try:
         with open(abs_path, 'wb') as f:
             while True:
@@ -298,6 +300,7 @@ def upload_document(
                     except Exception:
                         pass
                     return BadRequest(message="File too large")
+                sha256.update(chunk)
                 f.write(chunk)
     except Exception:
         try:
@@ -327,6 +330,7 @@ def upload_document(
             storage_uri=storage_uri,
             vector_source=f"doc:{uid}",
             uploaded_by=current_user.id,
+            content_sha256=sha256.hexdigest(),
         )
     except ValueError:
         # Clean up file if KB not found/owned
@@ -354,8 +358,7 @@ def upload_document(
 
     # schedule background indexing
     try:
-        if background_tasks is not None:
-            background_tasks.add_task(index_document_background, kb_id, doc.id, current_user.id)
+        schedule_index(background_tasks, kb_id, doc.id, current_user.id)
     except Exception:
         logger = logging.getLogger(__name__)
         logger.debug("[kb.upload] schedule_index_failed kb=%s doc=%s", kb_id, doc.id)
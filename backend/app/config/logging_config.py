@@ -0,0 +1,139 @@
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from typing import Any, Dict, Optional
+
+from .settings import settings
+
+# App logging: every "app.*" logger writes through a QueueHandler so request threads and
+# the event loop never block on log I/O; a QueueListener thread does the formatting and
+# writing. Per-event sampling (LOG_SAMPLE_RATES) drops records before they are queued;
+# log_event() decides up front, so a sampled-out event never builds a record.
+#
+# Events are the "[tag] event" prefix of the message, e.g. "[chat] turn_summary",
+# or the `event` passed to log_event().
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Per-chunk stream events stay off unless LOG_SAMPLE_RATES gives them a rate.
+DEFAULT_SAMPLE_RATES: Dict[str, float] = {
+    "[astream_chat] recv_chunk": 0.0,
+    "[llm.achat_completion_stream] recv_line": 0.0,
+}
+_sample_rates: Dict[str, float] = {**DEFAULT_SAMPLE_RATES, **settings.LOG_SAMPLE_RATES}
+
+_RESERVED = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+def _event_name(record: logging.LogRecord) -> str:
+    event = getattr(record, "event", None)
+    if event:
+        return event
+    msg = record.msg if isinstance(record.msg, str) else ""
+    return " ".join(msg.split(" ", 2)[:2])
+
+
+def _keep(event: str, level: int, rates: Dict[str, float]) -> bool:
+    if level >= logging.WARNING:
+        return True
+    rate = rates.get(event)
+    return rate is None or random.random() < rate
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a record with probability LOG_SAMPLE_RATES[event]; unlisted events are kept.
+
+    Warnings and errors are never sampled out. Records from log_event() were already
+    sampled and pass through.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rates or getattr(record, "event", None):
+            return True
+        return _keep(_event_name(record), record.levelno, self.rates)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed via extra= become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            type(self).dropped += 1
+
+
+def setup_logging() -> None:
+    """Configure the "app" logger tree (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+    if (settings.LOG_FORMAT or "text").lower() == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    sink = logging.StreamHandler()
+    sink.setFormatter(formatter)
+
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    handler = _DroppingQueueHandler(q)
+    handler.addFilter(SamplingFilter(_sample_rates))
+
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(getattr(logging, (settings.LOG_LEVEL or "INFO").upper(), logging.INFO))
+    app_logger.handlers = [handler]
+    app_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(q, sink, respect_handler_level=False)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """Emit one structured record: "event k=v ..." in text, top-level keys in JSON.
+
+    Sampled per LOG_SAMPLE_RATES before anything is formatted, so it is cheap to call
+    on per-chunk paths.
+    """
+    if not logger.isEnabledFor(level) or not _keep(event, level, _sample_rates):
+        return
+    logger.log(
+        level,
+        "%s %s",
+        event,
+        " ".join(f"{k}={v}" for k, v in fields.items()),
+        extra={"event": event, **{(f"field_{k}" if k in _RESERVED else k): v for k, v in fields.items()}},
+    )
@@ -9,3 +9,7 @@ redis_client = redis.Redis(
 
 def get_redis_client():
     return redis_client
+
+def make_redis_client(db: int):
+    """A client for another logical DB on the same server (e.g. evictable caches)."""
+    return redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=db)
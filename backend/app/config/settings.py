@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Dict, Optional
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -36,12 +36,37 @@ class Settings(BaseSettings):
     MAIL_TLS: bool = True
     MAIL_SSL: bool = True
 
+    # Logging
+    LOG_LEVEL: str = "INFO"  # level of the "app" logger tree
+    LOG_FORMAT: str = "text"  # text | json
+    LOG_QUEUE_SIZE: int = 10000  # records beyond this are dropped rather than blocking callers
+    LOG_SAMPLE_RATES: Dict[str, float] = {}  # e.g. {"[astream_chat] recv_chunk": 0.01}; per-chunk events default to 0
+
+    METRICS_ENABLED: bool = True  # Prometheus /metrics (needs prometheus_client)
+
     # LLM / Chat settings
     SILICONFLOW_API_KEY: Optional[str] = None
     LLM_DEFAULT_MODEL: str = "moonshotai/Kimi-K2-Instruct-0905"
-    LLM_MAX_TURNS: int = 12  # max turns to include in context window
+    LLM_MAX_TURNS: int = 50  # upper bound on history turns loaded; the token budget decides what fits
     LLM_MAX_TOKENS: int = 1024  # default completion tokens cap
+    LLM_CONTEXT_WINDOW: int = 32768  # prompt + completion tokens, unless overridden per model
+    LLM_CONTEXT_WINDOWS: Dict[str, int] = {}  # e.g. {"moonshotai/Kimi-K2-Instruct-0905": 131072}
+    LLM_CONTEXT_RESERVE_TOKENS: int = 256  # slack for tokenizer mismatch with the provider
+    LLM_TOKENIZER_DIR: Optional[str] = None  # <dir>/<model>/tokenizer.json; estimate used when missing
+    LLM_TOKEN_ESTIMATE_MARGIN: float = 1.25  # scales the estimate, which can undercount code and rare scripts
     LLM_API_BASE: str = "https://api.siliconflow.cn/v1"
+    LLM_STREAM_INCLUDE_USAGE: bool = True  # request stream_options.include_usage for token counts on streams
+    # write the user and assistant messages of a turn in one transaction once the answer is
+    # done; the user message is then not visible to concurrent readers until that point
+    CHAT_BATCH_TURN_WRITES: bool = False
+
+    # Shared outbound HTTP client pool (embedding / rerank / LLM)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP_DEFAULT_TIMEOUT: float = 60.0
+    HTTP2_ENABLED: bool = True
 
     # File storage
     STORAGE_ROOT: str = "storage"
@@ -51,6 +76,8 @@ class Settings(BaseSettings):
     CHROMA_HOST: str = "localhost"
     CHROMA_PORT: int = 8001
     CHROMA_PATH: str = "./chroma_data"  # used only for embedded mode
+    CHROMA_COLLECTION_CACHE_SIZE: int = 256  # cached collection handles per process
+    CHROMA_DELETE_BATCH_SIZE: int = 500  # ids per get/delete request
 
     # Embedding / indexing defaults
     EMBEDDING_MODEL_DEFAULT: str = "BAAI/bge-m3"
@@ -58,14 +85,62 @@ class Settings(BaseSettings):
     CHUNK_OVERLAP_DEFAULT: int = 200
     PARSE_STRATEGY_DEFAULT: str = "auto"
 
+    # Background indexing queue (Redis) consumed by `python -m app.worker`
+    INDEX_QUEUE_ENABLED: bool = True  # False: index inside the API process via BackgroundTasks
+    INDEX_WORKER_CONCURRENCY: int = 2
+    INDEX_QUEUE_VISIBILITY_TIMEOUT: int = 600  # seconds before an unacknowledged job is requeued
+    INDEX_QUEUE_MAX_ATTEMPTS: int = 3
+    INDEX_QUEUE_RETRY_DELAY_SECONDS: float = 30.0  # backoff before the first retry, doubled per attempt
+    INDEX_QUEUE_POLL_SECONDS: int = 5
+    WORKER_METRICS_PORT: int = 9101  # worker's own Prometheus endpoint (ingestion metrics); 0 disables
+    WORKER_METRICS_PORT_RANGE: int = 16  # workers on one host take the next free port up to PORT + RANGE - 1
+    EMBEDDING_BATCH_SIZE: int = 32  # max inputs per embeddings request
+    EMBEDDING_BATCH_MAX_CHARS: int = 32000  # max total chars per embeddings request
+    EMBEDDING_MAX_WORKERS: int = 4  # concurrent embeddings requests per call
+    EMBEDDING_MAX_RETRIES: int = 3
+    EMBEDDING_RETRY_BACKOFF: float = 0.5  # seconds, doubled per attempt
+    EMBEDDING_TIMEOUT_SECONDS: float = 60.0  # per request while indexing
+    EMBEDDING_QUERY_MAX_RETRIES: int = 1  # chat-path query embeddings: fail fast
+    EMBEDDING_QUERY_TIMEOUT_SECONDS: float = 10.0
+    INDEX_PIPELINE_BATCH_SIZE: int = 64  # chunks per embed + upsert step while indexing
+    INDEX_PIPELINE_QUEUE_SIZE: int = 4  # batches buffered between pipeline stages
+    INDEX_PROGRESS_EVERY_BATCHES: int = 4  # write chunks_indexed every N batches; 0 disables
+    EMBEDDING_CACHE_BACKEND: str = "disk"  # "disk" | "redis" | "none"
+    EMBEDDING_CACHE_PATH: Optional[str] = None  # disk backend; defaults to <STORAGE_ROOT>/embedding_cache.sqlite3
+    EMBEDDING_CACHE_REDIS_DB: int = 1  # redis backend; keep apart from REDIS_DB, which holds the index queue
+    EMBEDDING_CACHE_TTL_SECONDS: int = 30 * 24 * 3600  # 0 disables expiry
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 500_000  # LRU bound enforced by the cache itself; 0 disables
+    QUERY_EMBEDDING_CACHE_SIZE: int = 2048  # in-process query vector LRU; 0 disables
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: int = 3600  # 0 disables expiry
+
     # Retrieval / RAG settings
     RAG_ENABLED: bool = True
     RAG_TOP_K: int = 6
     RAG_PER_KB_K: int | None = None
+    CONV_KB_CACHE_TTL_SECONDS: int = 30  # per-process cache of a conversation's KB collections; 0 disables
+    RAG_RETRIEVAL_MAX_WORKERS: int = 16  # chat turns retrieving concurrently with their DB work
+    RAG_QUERY_MAX_WORKERS: int = 8  # concurrent per-KB Chroma queries (process-wide)
+    RAG_QUERY_TIMEOUT_SECONDS: float = 5.0  # per-collection budget; late collections are skipped
+    LEXICAL_INDEX_ENABLED: bool = True  # per-KB BM25 index built at ingest, fused with dense hits
+    LEXICAL_INDEX_DIR: Optional[str] = None  # defaults to <STORAGE_ROOT>/lexical
+    RAG_RRF_K: int = 60  # reciprocal-rank fusion constant
     RERANK_ENABLED: bool = False
     RERANK_MODEL: str = "BAAI/bge-reranker-v2-m3"
     RERANK_TOP_N: int = 6
-    MAX_CONTEXT_CHARS: int = 8000
+    RERANK_CACHE_SIZE: int = 20000  # (model, query, chunk) relevance scores kept in-process; 0 disables
+    # Pre-rerank trimming
+    RERANK_DEDUP_SIMILARITY: float = 0.9  # char 5-gram Jaccard at which a lower-ranked chunk is dropped
+    RERANK_DISTANCE_CAP_RATIO: float = 2.0  # drop dense hits farther than best_distance * ratio; 0 disables
+    RERANK_MAX_CANDIDATES: int = 30
+    RERANK_MAX_TOKENS: int = 480  # chunk text sent to the reranker (query shares its window)
+    RERANK_SKIP_GAP: float = 0.25  # skip rerank when (d2 - d1) / d2 of the top dense hits >= gap; 0 disables
+    # Semantic answer cache for RAG turns (opt-in; ignores conversation history)
+    ANSWER_CACHE_ENABLED: bool = False  # default for requests that don't set use_answer_cache
+    ANSWER_CACHE_SIMILARITY: float = 0.95  # min cosine similarity between query embeddings
+    ANSWER_CACHE_TTL_SECONDS: int = 86400
+    ANSWER_CACHE_MAX_PER_SCOPE: int = 200  # entries kept per (model, KB set, KB versions)
+    RAG_CONTEXT_SHARE: float = 0.6  # max share of the prompt budget given to retrieved chunks
+    RAG_CHUNK_MAX_TOKENS: int = 512  # longer chunks are truncated
 
     # Title generation
     LLM_TITLE_MODEL: Optional[str] = None  # fallback to LLM_DEFAULT_MODEL if None
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import time
 import uuid as uuidlib
 import logging
-from typing import List, Optional, Tuple
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import case, desc, func, update
 
+from app.config.settings import settings
 from app.models.chat import Conversation, ConversationKB, Message
+from app.models.knowledge import KnowledgeBase
 
 logger = logging.getLogger(__name__)
 
+# (conversation_id, user_id) -> (expires_at, [(kb_id, chroma_collection), ...])
+_collections_cache: Dict[Tuple[int, int], Tuple[float, List[Tuple[int, str]]]] = {}
+_collections_lock = threading.Lock()
+
 
 def create_conversation(db: Session, user_id: int, title: Optional[str], kb_ids: Optional[List[int]], model: Optional[str]) -> Conversation:
     conv = Conversation(
@@ -25,6 +34,7 @@ def create_conversation(db: Session, user_id: int, title: Optional[str], kb_ids:
             db.add(ConversationKB(conversation_id=conv.id, kb_id=kb_id))
     db.commit()
     db.refresh(conv)
+    invalidate_conversation_collections(conversation_id=conv.id)
     return conv
 
 
@@ -67,45 +77,107 @@ def list_conversation_kb_ids(db: Session, conversation_id: int) -> List[int]:
     return [r.kb_id for r in rows]
 
 
+def list_conversation_collections(db: Session, conversation_id: int, user_id: int) -> List[Tuple[int, str]]:
+    """(kb_id, chroma_collection) for the conversation's live KBs owned by user_id, in one query.
+
+    Cached per conversation for CONV_KB_CACHE_TTL_SECONDS; KB changes made in this
+    process invalidate immediately, other processes see them once the TTL lapses.
+    """
+    key = (conversation_id, user_id)
+    now = time.monotonic()
+    with _collections_lock:
+        hit = _collections_cache.get(key)
+        if hit and hit[0] > now:
+            return list(hit[1])
+
+    rows = (
+        db.query(KnowledgeBase.id, KnowledgeBase.chroma_collection)
+        .join(ConversationKB, ConversationKB.kb_id == KnowledgeBase.id)
+        .filter(
+            ConversationKB.conversation_id == conversation_id,
+            KnowledgeBase.owner_id == user_id,
+            KnowledgeBase.deleted_at.is_(None),
+            KnowledgeBase.chroma_collection.isnot(None),
+        )
+        .order_by(ConversationKB.id)
+        .all()
+    )
+    out = [(int(kb_id), name) for kb_id, name in rows]
+    if settings.CONV_KB_CACHE_TTL_SECONDS > 0:
+        with _collections_lock:
+            _collections_cache[key] = (now + settings.CONV_KB_CACHE_TTL_SECONDS, out)
+    return list(out)
+
+
+def invalidate_conversation_collections(conversation_id: Optional[int] = None, kb_id: Optional[int] = None) -> None:
+    """Drop cached KB resolution for a conversation, for every conversation using kb_id,
+    or everything when both are None."""
+    with _collections_lock:
+        if conversation_id is None and kb_id is None:
+            _collections_cache.clear()
+            return
+        for key, (_exp, cols) in list(_collections_cache.items()):
+            if key[0] == conversation_id or (kb_id is not None and any(k == kb_id for k, _ in cols)):
+                _collections_cache.pop(key, None)
+
+
+def add_messages(db: Session, conversation_id: int, messages: List[Message]) -> List[Message]:
+    """Insert messages and bump the conversation timestamps in one transaction.
+
+    Ids come back from the INSERT (RETURNING or the driver's last insert id) and the
+    timestamps are set with one conditional UPDATE, so nothing is read back; server
+    defaults the INSERT could not return (created_at on MySQL) load on first access.
+    """
+    for m in messages:
+        m.conversation_id = conversation_id
+    db.add_all(messages)
+    db.flush()
+    db.execute(
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(
+            first_message_at=func.coalesce(Conversation.first_message_at, func.now()),
+            last_message_at=func.now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    # keep the flushed state (ids) instead of expiring it and reloading on next access
+    expire = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire
+    for m in messages:
+        logger.debug(
+            "[crud_chat] message_persisted conv=%s id=%s role=%s model=%s len=%s",
+            conversation_id,
+            m.id,
+            m.role,
+            m.model,
+            len(m.content or ""),
+        )
+    return messages
+
+
 def add_message(db: Session, conversation_id: int, role: str, content: Optional[str], model: Optional[str] = None,
                 tokens_prompt: Optional[int] = None, tokens_completion: Optional[int] = None,
-                latency_ms: Optional[int] = None, error: Optional[str] = None) -> Message:
+                latency_ms: Optional[int] = None, error: Optional[str] = None,
+                ttft_ms: Optional[int] = None, retrieval_ms: Optional[int] = None,
+                tokens_per_second: Optional[float] = None) -> Message:
     msg = Message(
-        conversation_id=conversation_id,
         role=role,
         content=content,
         model=model,
         tokens_prompt=tokens_prompt,
         tokens_completion=tokens_completion,
         latency_ms=latency_ms,
+        ttft_ms=ttft_ms,
+        retrieval_ms=retrieval_ms,
+        tokens_per_second=tokens_per_second,
         error=error,
     )
-    db.add(msg)
-
-    # update conversation timestamps
-    conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-    if conv:
-        from sqlalchemy.sql import func as sqlfunc
-        if conv.first_message_at is None:
-            conv.first_message_at = sqlfunc.now()
-        conv.last_message_at = sqlfunc.now()
-
-    db.commit()
-    db.refresh(msg)
-    try:
-        preview = (content or error or "")[:120]
-        logger.info(
-            "[crud_chat] message_persisted conv=%s id=%s role=%s model=%s len=%s preview=%r",
-            conversation_id,
-            msg.id,
-            role,
-            model,
-            len(content or ""),
-            preview,
-        )
-    except Exception:
-        pass
-    return msg
+    return add_messages(db, conversation_id, [msg])[0]
 
 
 def list_messages(db: Session, conversation_id: int, user_id: int, limit: int = 50, before_id: Optional[int] = None,
@@ -146,6 +218,56 @@ def get_message_counts_for_conversations(db: Session, conversation_ids: List[int
     return out
 
 
+def get_model_stats(db: Session, user_id: int, since: Optional[datetime] = None) -> List[dict]:
+    """Per-model latency and token usage of the user's assistant messages.
+
+    Averages skip NULLs, so cached answers (no TTFT/throughput) and rows without
+    provider usage only count towards the columns they have.
+    """
+    q = (
+        db.query(
+            Message.model,
+            func.count(Message.id),
+            func.sum(case((Message.error.isnot(None), 1), else_=0)),
+            func.avg(Message.latency_ms),
+            func.max(Message.latency_ms),
+            func.avg(Message.ttft_ms),
+            func.max(Message.ttft_ms),
+            func.avg(Message.retrieval_ms),
+            func.avg(Message.tokens_per_second),
+            func.sum(Message.tokens_prompt),
+            func.sum(Message.tokens_completion),
+            func.count(Message.tokens_completion),
+        )
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .filter(Conversation.user_id == user_id, Message.role == "assistant")
+    )
+    if since is not None:
+        q = q.filter(Message.created_at >= since)
+    rows = q.group_by(Message.model).order_by(desc(func.count(Message.id))).all()
+
+    def _num(v, digits=1):
+        return round(float(v), digits) if v is not None else None
+
+    return [
+        {
+            "model": model,
+            "messages": int(n),
+            "errors": int(errors or 0),
+            "avg_latency_ms": _num(avg_lat),
+            "max_latency_ms": max_lat,
+            "avg_ttft_ms": _num(avg_ttft),
+            "max_ttft_ms": max_ttft,
+            "avg_retrieval_ms": _num(avg_ret),
+            "avg_tokens_per_second": _num(avg_tps, 2),
+            "tokens_prompt": int(tp or 0),
+            "tokens_completion": int(tc or 0),
+            "messages_with_usage": int(n_usage),
+        }
+        for model, n, errors, avg_lat, max_lat, avg_ttft, max_ttft, avg_ret, avg_tps, tp, tc, n_usage in rows
+    ]
+
+
 def soft_delete_conversation(db: Session, conversation_id: int, user_id: int) -> bool:
     """Soft delete a conversation if owned by user.
 
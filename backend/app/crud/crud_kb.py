@@ -7,6 +7,7 @@ from typing import List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 
+from app.crud import crud_chat
 from app.models.knowledge import KnowledgeBase
 
 logger = logging.getLogger(__name__)
@@ -108,6 +109,7 @@ def update_kb(
     db.add(kb)
     db.commit()
     db.refresh(kb)
+    crud_chat.invalidate_conversation_collections(kb_id=kb.id)
     return kb
 
 
@@ -118,4 +120,21 @@ def soft_delete_kb(db: Session, kb: KnowledgeBase) -> None:
     kb.deleted_at = sqlfunc.now()
     db.add(kb)
     db.commit()
+    crud_chat.invalidate_conversation_collections(kb_id=kb.id)
+
+    # drop the cached Chroma handle so a deleted KB's collection is not reused
+    try:
+        from app.services import chroma_client
+
+        chroma_client.invalidate_collection(kb.chroma_collection)
+    except Exception:
+        logger.debug("[crud_kb] collection_invalidate_failed kb=%s", kb.id)
+
+    # the BM25 index file is per collection and otherwise outlives the KB
+    try:
+        from app.services import lexical_index
+
+        lexical_index.drop_collection(kb.chroma_collection)
+    except Exception:
+        logger.warning("[crud_kb] lexical_drop_failed kb=%s", kb.id, exc_info=True)
 
@@ -79,6 +79,56 @@ def get_document(
     )
 
 
+def list_documents_by_status(db: Session, status: str) -> List[Tuple[KnowledgeDocument, int]]:
+    """Return (document, kb owner_id) for live documents in live KBs with the given status."""
+    rows = (
+        db.query(KnowledgeDocument, KnowledgeBase.owner_id)
+        .join(KnowledgeBase, KnowledgeBase.id == KnowledgeDocument.kb_id)
+        .filter(
+            KnowledgeDocument.status == status,
+            KnowledgeDocument.deleted_at.is_(None),
+            KnowledgeBase.deleted_at.is_(None),
+        )
+        .order_by(KnowledgeDocument.id)
+        .all()
+    )
+    return [(doc, int(owner_id)) for doc, owner_id in rows]
+
+
+def list_processed_by_sha256(
+    db: Session,
+    content_sha256: str,
+    *,
+    embedding_model: str,
+    exclude_doc_id: Optional[int] = None,
+    prefer_kb_id: Optional[int] = None,
+    limit: int = 10,
+) -> List[Tuple[KnowledgeDocument, KnowledgeBase]]:
+    """Processed live documents with the same file hash and embedding model, in any live KB.
+
+    Documents in prefer_kb_id come first.
+    """
+    query = (
+        db.query(KnowledgeDocument, KnowledgeBase)
+        .join(KnowledgeBase, KnowledgeBase.id == KnowledgeDocument.kb_id)
+        .filter(
+            KnowledgeDocument.content_sha256 == content_sha256,
+            KnowledgeDocument.embedding_model == embedding_model,
+            KnowledgeDocument.status == "processed",
+            KnowledgeDocument.chunk_count > 0,
+            KnowledgeDocument.deleted_at.is_(None),
+            KnowledgeBase.deleted_at.is_(None),
+        )
+    )
+    if exclude_doc_id is not None:
+        query = query.filter(KnowledgeDocument.id != exclude_doc_id)
+    order = [desc(KnowledgeDocument.id)]
+    if prefer_kb_id is not None:
+        order.insert(0, desc(KnowledgeDocument.kb_id == prefer_kb_id))
+    rows = query.order_by(*order).limit(limit).all()
+    return [(doc, kb) for doc, kb in rows]
+
+
 def _recompute_kb_aggregates(db: Session, kb: KnowledgeBase) -> None:
     q = (
         db.query(
@@ -108,6 +158,7 @@ def create_document(
     storage_uri: Optional[str] = None,
     vector_source: Optional[str] = None,
     uploaded_by: Optional[int] = None,
+    content_sha256: Optional[str] = None,
 ) -> KnowledgeDocument:
     kb = _get_owned_kb(db, kb_id, owner_id)
     if not kb:
@@ -130,6 +181,7 @@ def create_document(
         vector_source=vector_source,
         chunk_count=0,
         uploaded_by=uploaded_by,
+        content_sha256=content_sha256,
     )
     db.add(doc)
     db.flush()
@@ -178,8 +230,11 @@ def update_document_status(
     status: Optional[str] = None,
     error: Optional[str] = None,
     chunk_count: Optional[int] = None,
+    chunks_indexed: Optional[int] = None,
     processed_at: Optional[Any] = None,
     ingest_params: Optional[str] = None,
+    chunk_hashes: Optional[str] = None,
+    embedding_model: Optional[str] = None,
 ) -> Optional[KnowledgeDocument]:
     doc = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == doc_id).first()
     if not doc:
@@ -194,12 +249,21 @@ def update_document_status(
     if chunk_count is not None:
         doc.chunk_count = int(chunk_count)
         changed = True
+    if chunks_indexed is not None:
+        doc.chunks_indexed = int(chunks_indexed)
+        changed = True
     if processed_at is not None:
         doc.processed_at = processed_at
         changed = True
     if ingest_params is not None:
         doc.ingest_params = ingest_params
         changed = True
+    if chunk_hashes is not None:
+        doc.chunk_hashes = chunk_hashes
+        changed = True
+    if embedding_model is not None:
+        doc.embedding_model = embedding_model
+        changed = True
     if changed:
         db.add(doc)
         db.commit()
@@ -1,31 +1,27 @@
-import logging
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import auth
 from app.api.endpoints import chat
 from app.api.endpoints import kb
+from app.config.logging_config import setup_logging, shutdown_logging
+from app.services import http_client, metrics
 
-def _setup_logging() -> None:
-    """Route app logs through uvicorn logger and set INFO level for our modules."""
-    uvicorn_logger = logging.getLogger("uvicorn.error")
-    targets = [
-        "app.services.chat_service",
-        "app.services.llm_service",
-        "app.crud.crud_chat",
-        "app.api.endpoints.chat",
-    ]
-    for name in targets:
-        logger = logging.getLogger(name)
-        logger.setLevel(logging.INFO)
-        if uvicorn_logger.handlers:
-            logger.handlers = uvicorn_logger.handlers
-        logger.propagate = False
-
-
-_setup_logging()
+setup_logging()
 
 app = FastAPI(title="FastAPI Project Template")
 
+
+@app.on_event("startup")
+async def _startup() -> None:
+    await http_client.startup()
+
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    await http_client.shutdown()
+    shutdown_logging()
+
+
 # Main router with /api/v1 prefix
 api_router = APIRouter(prefix="/api/v1")
 api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
@@ -46,6 +42,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if metrics.enabled:
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics():
+        payload, content_type = metrics.render()
+        return Response(content=payload, media_type=content_type)
+
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the API"}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP, Boolean
+from sqlalchemy import Column, Integer, Float, String, Text, ForeignKey, TIMESTAMP, Boolean
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -42,6 +42,9 @@ class Message(Base):
     tokens_prompt = Column(Integer, nullable=True)
     tokens_completion = Column(Integer, nullable=True)
     latency_ms = Column(Integer, nullable=True)
+    ttft_ms = Column(Integer, nullable=True)  # LLM request start -> first content (assistant)
+    retrieval_ms = Column(Integer, nullable=True)
+    tokens_per_second = Column(Float, nullable=True)  # completion tokens / generation time
     model = Column(String(128), nullable=True)
     error = Column(Text, nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now(), index=True)
@@ -52,6 +52,7 @@ class KnowledgeDocument(Base):
     mime_type = Column(String(100), nullable=True)
     storage_uri = Column(String(255), nullable=True)
     size_bytes = Column(BigInteger, nullable=True)
+    content_sha256 = Column(String(64), nullable=True, index=True)
     page_count = Column(Integer, nullable=True)
 
     status = Column(String(16), nullable=False, default="uploaded")
@@ -60,8 +61,10 @@ class KnowledgeDocument(Base):
 
     vector_source = Column(String(255), nullable=False)
     chunk_count = Column(Integer, nullable=False, default=0)
+    chunks_indexed = Column(Integer, nullable=False, default=0)  # progress of the current indexing run
     embedding_model = Column(String(128), nullable=True)
     ingest_params = Column(Text, nullable=True)
+    chunk_hashes = Column(Text(length=16777215), nullable=True)  # JSON list of per-chunk content hashes
 
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
 
@@ -33,6 +33,8 @@ class MessageCreate(BaseModel):
     retrieve_top_k: Optional[int] = Field(default=None, ge=1)
     use_rerank: Optional[bool] = None
     rerank_top_n: Optional[int] = Field(default=None, ge=1)
+    # serve a cached answer to a near-identical question on the same KBs (default: ANSWER_CACHE_ENABLED)
+    use_answer_cache: Optional[bool] = None
 
 
 class MessageOut(BaseModel):
@@ -43,6 +45,9 @@ class MessageOut(BaseModel):
     tokens_prompt: Optional[int] = None
     tokens_completion: Optional[int] = None
     latency_ms: Optional[int] = None
+    ttft_ms: Optional[int] = None
+    retrieval_ms: Optional[int] = None
+    tokens_per_second: Optional[float] = None
     created_at: Optional[str] = None
 
     class Config:
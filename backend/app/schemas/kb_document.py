@@ -22,12 +22,14 @@ class DocumentOut(BaseModel):
     mime_type: Optional[str] = None
     storage_uri: Optional[str] = None
     size_bytes: Optional[int] = None
+    content_sha256: Optional[str] = None
     page_count: Optional[int] = None
     status: str
     error: Optional[str] = None
     processed_at: Optional[datetime] = None
     vector_source: str
     chunk_count: int
+    chunks_indexed: int = 0
     created_at: Optional[datetime] = None
 
     class Config:
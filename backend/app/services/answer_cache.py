@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import time
+import base64
+import hashlib
+import logging
+import uuid as uuidlib
+from array import array
+from operator import mul
+from typing import Any, Dict, List, Optional
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Opt-in semantic cache of assistant answers for RAG turns.
+#   kbver:{kb_id}        index version of a KB, bumped whenever one of its documents
+#                        is (re)indexed or deleted
+#   anscache:{scope}     hash entry_id -> json entry; scope = sha1(model, kb ids@versions)
+# A version bump changes the scope, so stale answers are never looked up again and
+# simply expire with ANSWER_CACHE_TTL_SECONDS.
+VERSION_KEY = "kbver:{kb_id}"
+SCOPE_KEY = "anscache:{scope}"
+
+
+def _redis():
+    from app.config.redis_config import get_redis_client
+
+    return get_redis_client()
+
+
+def bump_kb_version(kb_id: int) -> None:
+    """Invalidate cached answers that used this KB. Never raises."""
+    try:
+        _redis().incr(VERSION_KEY.format(kb_id=int(kb_id)))
+    except Exception:
+        logger.warning("[answer_cache] bump_failed kb=%s", kb_id)
+
+
+def _pack(vec: List[float]) -> str:
+    return base64.b64encode(array("f", vec).tobytes()).decode("ascii")
+
+
+def _unpack(raw: str) -> List[float]:
+    a = array("f")
+    a.frombytes(base64.b64decode(raw))
+    return a.tolist()
+
+
+def _normalize(vec: List[float]) -> List[float]:
+    norm = sum(x * x for x in vec) ** 0.5
+    return [x / norm for x in vec] if norm else list(vec)
+
+
+class Probe:
+    """Result of a cache lookup; also carries what is needed to store the answer later."""
+
+    def __init__(self, scope: str, vector: List[float], query: str):
+        self.scope = scope
+        self.vector = vector
+        self.query = query
+        self.hit: Optional[Dict[str, Any]] = None
+        self.similarity: float = 0.0
+
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        if not self.hit:
+            return None
+        return {
+            "hit": True,
+            "similarity": round(self.similarity, 4),
+            "source_message_id": self.hit.get("message_id"),
+            "cached_at": self.hit.get("created"),
+        }
+
+
+def _scope(model: str, kb_ids: List[int]) -> str:
+    ids = sorted({int(k) for k in kb_ids})
+    versions = _redis().mget([VERSION_KEY.format(kb_id=k) for k in ids])
+    parts = [f"{k}@{int(v or 0)}" for k, v in zip(ids, versions)]
+    return hashlib.sha1(f"{model}|{','.join(parts)}".encode("utf-8")).hexdigest()
+
+
+def lookup(model: str, kb_ids: List[int], query: str) -> Optional[Probe]:
+    """Embed the query and look for a cached answer in the same (model, KB versions) scope.
+
+    Returns None when the cache is unavailable; otherwise a Probe whose .hit is set
+    when an entry's query embedding is within ANSWER_CACHE_SIMILARITY (cosine).
+    """
+    if not kb_ids:
+        return None
+    from app.services.embedding_cache import normalize_query
+    from app.services.embedding_service import embed_query
+
+    try:
+        scope = _scope(model, kb_ids)
+        vec = _normalize(embed_query(query))
+        probe = Probe(scope, vec, normalize_query(query))
+        raw_entries = _redis().hvals(SCOPE_KEY.format(scope=scope))
+    except Exception:
+        logger.warning("[answer_cache] lookup_failed model=%s kbs=%s", model, kb_ids, exc_info=True)
+        return None
+
+    best, best_sim = None, -1.0
+    for raw in raw_entries:
+        try:
+            entry = json.loads(raw)
+            if entry.get("query") == probe.query:
+                best, best_sim = entry, 1.0
+                break
+            sim = sum(map(mul, vec, _unpack(entry["vec"])))
+        except Exception:
+            continue
+        if sim > best_sim:
+            best, best_sim = entry, sim
+    if best is not None and best_sim >= settings.ANSWER_CACHE_SIMILARITY:
+        probe.hit, probe.similarity = best, best_sim
+    logger.info(
+        "[answer_cache] lookup scope=%s entries=%s hit=%s sim=%.4f",
+        scope[:12], len(raw_entries), probe.hit is not None, max(best_sim, 0.0),
+    )
+    return probe
+
+
+def store(probe: Optional[Probe], answer: Optional[str], *, model: str, message_id: Optional[int]) -> None:
+    """Remember an answer for the probe's scope, keeping at most ANSWER_CACHE_MAX_PER_SCOPE."""
+    if probe is None or probe.hit is not None or not answer or not probe.vector:
+        return
+    key = SCOPE_KEY.format(scope=probe.scope)
+    entry = {
+        "query": probe.query,
+        "vec": _pack(probe.vector),
+        "answer": answer,
+        "model": model,
+        "message_id": message_id,
+        "created": int(time.time()),
+    }
+    try:
+        r = _redis()
+        pipe = r.pipeline()
+        pipe.hset(key, uuidlib.uuid4().hex, json.dumps(entry, ensure_ascii=False))
+        if settings.ANSWER_CACHE_TTL_SECONDS:
+            pipe.expire(key, settings.ANSWER_CACHE_TTL_SECONDS)
+        pipe.hlen(key)
+        size = pipe.execute()[-1]
+        overflow = int(size) - settings.ANSWER_CACHE_MAX_PER_SCOPE
+        if overflow > 0:
+            entries = []
+            for field, raw in r.hgetall(key).items():
+                try:
+                    entries.append((json.loads(raw).get("created") or 0, field))
+                except Exception:
+                    entries.append((0, field))
+            entries.sort()
+            r.hdel(key, *[field for _, field in entries[:overflow]])
+    except Exception:
+        logger.warning("[answer_cache] store_failed scope=%s", probe.scope[:12], exc_info=True)
+
+
+def sse_payloads(probe: Probe, piece_chars: int = 256) -> List[str]:
+    """Replay a cached answer as chat.completion.chunk payloads (first one carries `cache`)."""
+    answer = probe.hit.get("answer") or ""
+    model = probe.hit.get("model")
+    cid = f"cache-{uuidlib.uuid4().hex}"
+    payloads: List[str] = []
+    for i in range(0, max(len(answer), 1), piece_chars):
+        chunk: Dict[str, Any] = {
+            "id": cid,
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": answer[i:i + piece_chars]}, "finish_reason": None}],
+        }
+        if i == 0:
+            chunk["cache"] = probe.metadata()
+        payloads.append(json.dumps(chunk, ensure_ascii=False))
+    payloads.append(json.dumps({
+        "id": cid,
+        "object": "chat.completion.chunk",
+        "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+    }))
+    return payloads
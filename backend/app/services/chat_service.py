@@ -1,39 +1,324 @@
 from __future__ import annotations
 
+import json
 import time
 import logging
-from typing import Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+import anyio
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
+from app.config.logging_config import log_event
+from app.config.mysql_config import SessionLocal
 from app.config.settings import settings
-from app.crud import crud_chat, crud_kb
+from app.crud import crud_chat
 from app.models.chat import Message
+from app.services import answer_cache, metrics
 from app.services.llm_service import llm_client
 from app.services.retrieval_service import retrieve_collections
+from app.services.token_budget import context_window, count_messages, get_tokenizer
 
 logger = logging.getLogger(__name__)
 
+# Runs retrieval for a chat turn concurrently with the turn's DB work.
+_retrieval_executor = ThreadPoolExecutor(
+    max_workers=settings.RAG_RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix="rag-retrieve",
+)
 
-def build_context_messages(db: Session, conversation_id: int, user_id: int, new_content: str,
-                           model: Optional[str] = None) -> List[Dict[str, str]]:
-    # Fetch recent messages (last N turns)
+
+def load_history(db: Session, conversation_id: int, user_id: int,
+                 exclude_id: Optional[int] = None) -> List[Message]:
+    """Recent messages usable as chat history, oldest first (at most LLM_MAX_TURNS turns)."""
     history: List[Message] = crud_chat.get_recent_messages_for_context(
         db, conversation_id=conversation_id, user_id=user_id, max_turns=settings.LLM_MAX_TURNS
     )
-    msgs: List[Dict[str, str]] = []
-    # Optional system prompt could be added here
-    # msgs.append({"role": "system", "content": "You are a helpful assistant."})
+    return [
+        m for m in history
+        if m.id != exclude_id and m.role in ("user", "assistant", "system") and m.content
+    ]
+
+
+def resolve_rag_collections(db: Session, conversation_id: int, user_id: int) -> List[Dict[str, Any]]:
+    """Chroma collections of the conversation's live KBs owned by the user."""
+    return [
+        {"kb_id": kb_id, "collection": name}
+        for kb_id, name in crud_chat.list_conversation_collections(db, conversation_id, user_id)
+    ]
+
+
+_RAG_PROMPT_HEAD = "你是一个知识助手。以下是与用户问题相关的知识库片段：\n"
+_RAG_PROMPT_TAIL = "\n请优先基于这些片段回答；若无法从中得到答案，请明确说明不确定。"
+
+
+def format_rag_system_message(texts: List[str]) -> Optional[Dict[str, str]]:
+    if not texts:
+        return None
+    src = "\n".join(f"[{i}] {t}" for i, t in enumerate(texts, 1))
+    return {"role": "system", "content": _RAG_PROMPT_HEAD + src + _RAG_PROMPT_TAIL}
+
 
-    for m in history:
-        if m.role not in ("user", "assistant", "system"):
+def assemble_prompt(
+    model: Optional[str],
+    history: List[Message],
+    new_content: str,
+    chunks: List[Dict[str, Any]],
+    max_tokens: int,
+) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+    """Fit the RAG system prompt, history and the new message into the model's window.
+
+    The new message is always kept. Retrieved chunks (best first, each capped at
+    RAG_CHUNK_MAX_TOKENS) may use up to RAG_CONTEXT_SHARE of what is left after the
+    completion reserve; history fills the rest, newest whole turns first.
+    """
+    tok = get_tokenizer(model)
+    budget = context_window(model) - max_tokens - settings.LLM_CONTEXT_RESERVE_TOKENS
+    user_tokens = count_messages(tok, [new_content])[0]
+    remaining = budget - user_tokens
+
+    sys_msg = None
+    kept: List[str] = []
+    rag_tokens = 0
+    texts = [t for t in ((ch.get("text") or "").strip() for ch in chunks) if t]
+    if texts and remaining > 0:
+        frame = count_messages(tok, [_RAG_PROMPT_HEAD + _RAG_PROMPT_TAIL])[0]
+        chunk_budget = int(remaining * settings.RAG_CONTEXT_SHARE) - frame
+        for t, n in zip(texts, tok.count_many(texts)):
+            if n > settings.RAG_CHUNK_MAX_TOKENS:
+                t, n = tok.truncate(t, settings.RAG_CHUNK_MAX_TOKENS), settings.RAG_CHUNK_MAX_TOKENS
+            n += 2  # "[i] " marker and separator
+            if rag_tokens + n > chunk_budget:
+                continue  # a shorter, lower-ranked chunk may still fit
+            kept.append(t)
+            rag_tokens += n
+        if kept:
+            sys_msg = format_rag_system_message(kept)
+            rag_tokens += frame
+            remaining -= rag_tokens
+
+    # Whole turns only: a turn runs from a user message up to the next one, so a
+    # reply is never sent without the question it answers.
+    costs = count_messages(tok, [m.content for m in history], keys=[m.id for m in history])
+    start = len(history)
+    history_tokens = 0
+    for i in range(len(history) - 1, -1, -1):
+        if history[i].role != "user":
             continue
-        if m.content:
-            msgs.append({"role": m.role, "content": m.content})
+        turn = sum(costs[i:start])
+        if history_tokens + turn > remaining:
+            break
+        start = i
+        history_tokens += turn
 
-    # Append the new user message
+    msgs: List[Dict[str, str]] = [sys_msg] if sys_msg else []
+    msgs.extend({"role": m.role, "content": m.content} for m in history[start:])
     msgs.append({"role": "user", "content": new_content})
-    return msgs
+    stats = {
+        "prompt_tokens_est": user_tokens + rag_tokens + history_tokens,
+        "rag_chunks": len(kept),
+        "history_msgs": len(history) - start,
+    }
+    return msgs, stats
+
+
+def _timed(fn, *args, **kwargs):
+    t = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, int((time.perf_counter() - t) * 1000)
+
+
+def _retrieve_or_cached(
+    content: str,
+    collections: List[Dict[str, Any]],
+    *,
+    model: str,
+    use_answer_cache: bool,
+    **retrieve_kwargs,
+) -> Tuple[List[Dict[str, Any]], Optional[answer_cache.Probe]]:
+    """Probe the answer cache first; on a miss run retrieval as usual."""
+    probe = None
+    if use_answer_cache:
+        probe = answer_cache.lookup(model, [c["kb_id"] for c in collections], content)
+        if probe is not None and probe.hit is not None:
+            return [], probe
+    return retrieve_collections(query_text=content, collections=collections, **retrieve_kwargs), probe
+
+
+def prepare_turn(
+    db: Session,
+    conversation_id: int,
+    user_id: int,
+    content: str,
+    *,
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    rag_top_k: Optional[int] = None,
+    rag_use_rerank: Optional[bool] = None,
+    rag_rerank_top_n: Optional[int] = None,
+    use_answer_cache: Optional[bool] = None,
+    log_tag: str = "chat",
+) -> Tuple[Message, List[Dict[str, str]], Dict[str, int], Optional[answer_cache.Probe]]:
+    """Persist the user message and assemble the prompt for one chat turn.
+
+    Retrieval (query embedding, Chroma, rerank) needs no DB session, so it runs on a
+    worker thread while this thread writes the user message and loads history.
+    Returns (user message, prompt messages, turn stats, answer-cache probe); the stats hold
+    per-stage timings in ms and the prompt budget breakdown. With CHAT_BATCH_TURN_WRITES
+    the user message is returned unsaved and persisted with the answer by _save_turn.
+    When the probe has a hit the prompt is empty and the caller serves the cached answer.
+    """
+    t_start = time.perf_counter()
+    timings: Dict[str, int] = {}
+    future = None
+    if settings.RAG_ENABLED:
+        try:
+            collections, timings["kb_resolve_ms"] = _timed(resolve_rag_collections, db, conversation_id, user_id)
+            if collections:
+                future = _retrieval_executor.submit(
+                    _timed,
+                    _retrieve_or_cached,
+                    content,
+                    collections,
+                    model=(model or settings.LLM_DEFAULT_MODEL),
+                    use_answer_cache=(
+                        settings.ANSWER_CACHE_ENABLED if use_answer_cache is None else bool(use_answer_cache)
+                    ),
+                    top_k=(rag_top_k or settings.RAG_TOP_K),
+                    per_kb_k=settings.RAG_PER_KB_K,
+                    use_rerank=(settings.RERANK_ENABLED if rag_use_rerank is None else bool(rag_use_rerank)),
+                    rerank_top_n=(rag_rerank_top_n or settings.RERANK_TOP_N),
+                )
+        except Exception:
+            logger.exception("[%s] rag_resolve_failed conv=%s", log_tag, conversation_id)
+
+    if settings.CHAT_BATCH_TURN_WRITES:
+        # saved together with the answer by _save_turn
+        user_msg = Message(role="user", content=content)
+    else:
+        user_msg, timings["user_write_ms"] = _timed(
+            crud_chat.add_message, db, conversation_id, role="user", content=content
+        )
+    history, timings["history_ms"] = _timed(
+        load_history, db, conversation_id, user_id, exclude_id=user_msg.id
+    )
+
+    chunks: List[Dict[str, Any]] = []
+    probe: Optional[answer_cache.Probe] = None
+    if future is not None:
+        try:
+            (chunks, probe), timings["retrieval_ms"] = future.result()
+        except Exception:
+            logger.exception("[%s] rag_retrieve_failed conv=%s", log_tag, conversation_id)
+
+    if probe is not None and probe.hit is not None:
+        msgs: List[Dict[str, str]] = []
+        budget: Dict[str, Any] = {}
+    else:
+        (msgs, budget), timings["assemble_ms"] = _timed(
+            assemble_prompt, model, history, content, chunks, max_tokens or settings.LLM_MAX_TOKENS
+        )
+    timings["context_total_ms"] = int((time.perf_counter() - t_start) * 1000)
+    metrics.observe_chat_ms(timings)
+    logger.debug(
+        "[%s] context_built conv=%s turns=%s %s",
+        log_tag,
+        conversation_id,
+        len(msgs),
+        " ".join(f"{k}={v}" for k, v in {**budget, **timings}.items()),
+    )
+    return user_msg, msgs, {**budget, **timings}, probe
+
+
+_DATA_PREFIX = "data:"
+_CONTENT_KEY = '"content":'
+_scanstring = json.decoder.scanstring
+
+
+def _sse_json(line: str) -> Dict[str, Any]:
+    """Parse the JSON payload of one `data: {...}` SSE line."""
+    if line.startswith(_DATA_PREFIX):
+        line = line[len(_DATA_PREFIX):]
+    return json.loads(line)
+
+
+def _extract_piece(line: str) -> Optional[str]:
+    """Pull the text delta out of one provider SSE line (`data: {...}`).
+
+    Fast path: locate the first `"content":` key and decode only that string literal.
+    Anything else (non-string content, a malformed literal) falls back to parsing the
+    whole payload and reading choices[0].message/delta.content.
+    """
+    i = line.find(_CONTENT_KEY)
+    if i < 0:
+        return None
+    j = i + len(_CONTENT_KEY)
+    while line.startswith(" ", j):
+        j += 1
+    if line.startswith('"', j):
+        try:
+            return _scanstring(line, j + 1)[0] or None
+        except ValueError:
+            pass
+    elif line.startswith("null", j):
+        return None
+    choice = (_sse_json(line).get("choices") or [{}])[0]
+    msg = choice.get("message") or {}
+    delta = choice.get("delta") or {}
+    content = msg.get("content") or delta.get("content")
+    if isinstance(content, list):
+        # content parts: [{"type": "text", "text": ...}, ...]
+        content = "".join(p.get("text") or "" for p in content if isinstance(p, dict))
+    return content if isinstance(content, str) and content else None
+
+
+_USAGE_KEY = '"usage":'
+
+
+def _stream_usage(line: Optional[str]) -> Dict[str, Any]:
+    """`usage` of the last provider frame that mentioned it ({} when absent or null)."""
+    if not line:
+        return {}
+    try:
+        return _sse_json(line).get("usage") or {}
+    except Exception:
+        return {}
+
+
+def _generation_fields(
+    model: Optional[str],
+    content_out: Optional[str],
+    usage: Dict[str, Any],
+    ttft_ms: Optional[int],
+    latency_ms: int,
+) -> Dict[str, Any]:
+    """Token usage and throughput columns for an assistant message.
+
+    Throughput is completion tokens over the time after the first token (the whole
+    latency when there is no separate first token); without provider usage the
+    completion is counted with the local tokenizer for throughput only.
+    """
+    completion = usage.get("completion_tokens")
+    n = completion
+    if n is None and content_out:
+        n = get_tokenizer(model).count(content_out)
+    gen_ms = latency_ms - (ttft_ms or 0)
+    if gen_ms <= 0:
+        gen_ms = latency_ms
+    return {
+        "tokens_prompt": usage.get("prompt_tokens"),
+        "tokens_completion": completion,
+        "tokens_per_second": round(n * 1000.0 / gen_ms, 2) if n and gen_ms > 0 else None,
+    }
+
+
+def _save_turn(db: Session, conversation_id: int, user_msg: Message, **fields) -> Message:
+    """Persist the assistant message, plus the user message if it was deferred."""
+    asst = Message(role="assistant", **fields)
+    pending = [user_msg] if user_msg.id is None else []
+    crud_chat.add_messages(db, conversation_id, pending + [asst])
+    return asst
 
 
 def non_stream_chat(
@@ -49,67 +334,46 @@ def non_stream_chat(
     rag_top_k: Optional[int] = None,
     rag_use_rerank: Optional[bool] = None,
     rag_rerank_top_n: Optional[int] = None,
-) -> Tuple[Message, Message]:
+    use_answer_cache: Optional[bool] = None,
+) -> Tuple[Message, Message, Optional[Dict[str, Any]]]:
+    """Run one blocking chat turn; returns (user msg, assistant msg, answer-cache metadata)."""
     # persist user message
-    logger.info(
+    logger.debug(
         "[non_stream_chat] start conv=%s user=%s model=%s content_len=%s",
         conversation_id,
         user_id,
         (settings.LLM_DEFAULT_MODEL if model is None else model),
         len(content) if content is not None else 0,
     )
-    user_msg = crud_chat.add_message(db, conversation_id, role="user", content=content)
-
-    # build context
-    msgs = build_context_messages(db, conversation_id, user_id, new_content=content, model=model)
-
-    # RAG retrieval (prepend system message)
-    try:
-        if settings.RAG_ENABLED:
-            kb_ids = crud_chat.list_conversation_kb_ids(db, conversation_id)
-            if kb_ids:
-                collections = []
-                for kb_id in kb_ids:
-                    kb = crud_kb.get_kb(db, kb_id, owner_id=user_id)
-                    if kb and kb.chroma_collection:
-                        collections.append({"kb_id": kb_id, "collection": kb.chroma_collection})
-                if collections:
-                    chunks = retrieve_collections(
-                        query_text=content,
-                        collections=collections,
-                        top_k=(rag_top_k or settings.RAG_TOP_K),
-                        per_kb_k=settings.RAG_PER_KB_K,
-                        use_rerank=(settings.RERANK_ENABLED if rag_use_rerank is None else bool(rag_use_rerank)),
-                        rerank_top_n=(rag_rerank_top_n or settings.RERANK_TOP_N),
-                    )
-                    if chunks:
-                        parts: List[str] = []
-                        used = 0
-                        for i, ch in enumerate(chunks, 1):
-                            t = (ch.get("text") or "").strip()
-                            if not t:
-                                continue
-                            # limit per chunk
-                            t = t[:800]
-                            line = f"[{i}] {t}"
-                            if used + len(line) > settings.MAX_CONTEXT_CHARS:
-                                break
-                            parts.append(line)
-                            used += len(line)
-                        if parts:
-                            src = "\n".join(parts)
-                            sys_prompt = (
-                                "你是一个知识助手。以下是与用户问题相关的知识库片段：\n" + src +
-                                "\n请优先基于这些片段回答；若无法从中得到答案，请明确说明不确定。"
-                            )
-                            msgs.insert(0, {"role": "system", "content": sys_prompt})
-    except Exception:
-        logger.exception("[non_stream_chat] rag_inject_failed conv=%s", conversation_id)
-    logger.info(
-        "[non_stream_chat] context_built conv=%s turns=%s",
+    user_msg, msgs, stats, probe = prepare_turn(
+        db,
         conversation_id,
-        len(msgs),
+        user_id,
+        content,
+        model=model,
+        max_tokens=max_tokens,
+        rag_top_k=rag_top_k,
+        rag_use_rerank=rag_use_rerank,
+        rag_rerank_top_n=rag_rerank_top_n,
+        use_answer_cache=use_answer_cache,
+        log_tag="non_stream_chat",
     )
+    if probe is not None and probe.hit is not None:
+        asst_msg = _save_turn(
+            db,
+            conversation_id,
+            user_msg,
+            content=probe.hit.get("answer"),
+            model=(probe.hit.get("model") or model or settings.LLM_DEFAULT_MODEL),
+            latency_ms=0,
+            retrieval_ms=stats.get("retrieval_ms"),
+        )
+        metrics.count_turn("blocking", "cache_hit")
+        log_event(
+            logger, "[chat] turn_summary", mode="blocking", conv=conversation_id, model=asst_msg.model,
+            answer_cache="hit", source_msg=probe.hit.get("message_id"), **stats,
+        )
+        return user_msg, asst_msg, probe.metadata()
 
     t0 = time.time()
     try:
@@ -122,8 +386,12 @@ def non_stream_chat(
         )
     except Exception:
         logger.exception("[non_stream_chat] llm_chat_completion_failed conv=%s", conversation_id)
+        metrics.count_turn("blocking", "error")
+        if user_msg.id is None:
+            crud_chat.add_messages(db, conversation_id, [user_msg])
         raise
     latency_ms = int((time.time() - t0) * 1000)
+    metrics.observe_chat("llm_completion", latency_ms / 1000.0)
 
     # parse response
     choice = (resp.get("choices") or [{}])[0]
@@ -133,9 +401,11 @@ def non_stream_chat(
         # Fallback for providers that return plain text at choices[0].text
         content_out = choice.get("text")
     usage = resp.get("usage") or {}
-    tokens_prompt = usage.get("prompt_tokens")
-    tokens_completion = usage.get("completion_tokens")
-    logger.info(
+    # blocking: the first token reaches us with the whole answer
+    gen = _generation_fields(model, content_out, usage, latency_ms, latency_ms)
+    tokens_prompt = gen["tokens_prompt"]
+    tokens_completion = gen["tokens_completion"]
+    logger.debug(
         "[non_stream_chat] llm_done conv=%s latency_ms=%s out_len=%s prompt_tokens=%s completion_tokens=%s",
         conversation_id,
         latency_ms,
@@ -143,27 +413,74 @@ def non_stream_chat(
         tokens_prompt,
         tokens_completion,
     )
-    try:
-        preview = (content_out or "")[:200]
-        logger.info("[non_stream_chat] llm_output_preview conv=%s preview=%r", conversation_id, preview)
-    except Exception:
-        pass
-
-    asst_msg = crud_chat.add_message(
-        db,
-        conversation_id,
-        role="assistant",
-        content=content_out,
-        model=(resp.get("model") or model or settings.LLM_DEFAULT_MODEL),
-        tokens_prompt=tokens_prompt,
-        tokens_completion=tokens_completion,
-        latency_ms=latency_ms,
+    with metrics.chat_timer("assistant_write"):
+        asst_msg = _save_turn(
+            db,
+            conversation_id,
+            user_msg,
+            content=content_out,
+            model=(resp.get("model") or model or settings.LLM_DEFAULT_MODEL),
+            latency_ms=latency_ms,
+            ttft_ms=latency_ms,
+            retrieval_ms=stats.get("retrieval_ms"),
+            **gen,
+        )
+    metrics.count_turn("blocking", "ok")
+    answer_cache.store(probe, content_out, model=asst_msg.model, message_id=asst_msg.id)
+    log_event(
+        logger, "[chat] turn_summary", mode="blocking", conv=conversation_id, model=asst_msg.model,
+        llm_ms=latency_ms, out_len=len(content_out or ""), prompt_tokens=tokens_prompt,
+        completion_tokens=tokens_completion, tps=gen["tokens_per_second"], **stats,
     )
-    return user_msg, asst_msg
+    return user_msg, asst_msg, None
 
 
-def stream_chat_generator(
-    db: Session,
+def _prepare_stream(
+    conversation_id: int,
+    user_id: int,
+    content: str,
+    *,
+    model: Optional[str],
+    max_tokens: Optional[int],
+    rag_top_k: Optional[int],
+    rag_use_rerank: Optional[bool],
+    rag_rerank_top_n: Optional[int],
+    use_answer_cache: Optional[bool],
+) -> Tuple[Message, List[Dict[str, str]], Dict[str, Any], Optional[answer_cache.Probe]]:
+    """Blocking half of the async stream: persist the user message and build the prompt.
+
+    Uses its own short-lived session so no pooled connection is held while the LLM streams.
+    """
+    with SessionLocal() as db:
+        user_msg, msgs, stats, probe = prepare_turn(
+            db,
+            conversation_id,
+            user_id,
+            content,
+            model=model,
+            max_tokens=max_tokens,
+            rag_top_k=rag_top_k,
+            rag_use_rerank=rag_use_rerank,
+            rag_rerank_top_n=rag_rerank_top_n,
+            use_answer_cache=use_answer_cache,
+            log_tag="astream_chat",
+        )
+        logger.debug(
+            "[astream_chat] user_message_persisted conv=%s msg_id=%s",
+            conversation_id,
+            user_msg.id,
+        )
+    return user_msg, msgs, stats, probe
+
+
+def _persist_assistant(conversation_id: int, user_msg: Message, **fields) -> Optional[int]:
+    """Save the streamed answer with a fresh session; returns the message id."""
+    with metrics.chat_timer("assistant_write"), SessionLocal() as db:
+        msg = _save_turn(db, conversation_id, user_msg, **fields)
+        return msg.id if msg else None
+
+
+async def astream_chat_generator(
     conversation_id: int,
     user_id: int,
     content: str,
@@ -175,142 +492,150 @@ def stream_chat_generator(
     rag_top_k: Optional[int] = None,
     rag_use_rerank: Optional[bool] = None,
     rag_rerank_top_n: Optional[int] = None,
-) -> Iterable[str]:
-    # persist user message first
-    logger.info(
-        "[stream_chat] start conv=%s user=%s model=%s content_len=%s",
+    use_answer_cache: Optional[bool] = None,
+) -> AsyncIterator[str]:
+    """Run one streaming chat turn, yielding SSE frames.
+
+    DB access and retrieval run in the threadpool only for the short setup/persist steps,
+    each with its own short-lived session; the LLM stream itself is awaited on the event
+    loop, so an open SSE stream pins neither a worker thread nor a DB connection.
+    """
+    logger.debug(
+        "[astream_chat] start conv=%s user=%s model=%s content_len=%s",
         conversation_id,
         user_id,
         (settings.LLM_DEFAULT_MODEL if model is None else model),
         len(content) if content is not None else 0,
     )
-    user_msg = crud_chat.add_message(db, conversation_id, role="user", content=content)
-    logger.info(
-        "[stream_chat] user_message_persisted conv=%s msg_id=%s",
+    user_msg, msgs, stats, probe = await run_in_threadpool(
+        _prepare_stream,
         conversation_id,
-        user_msg.id,
+        user_id,
+        content,
+        model=model,
+        max_tokens=max_tokens,
+        rag_top_k=rag_top_k,
+        rag_use_rerank=rag_use_rerank,
+        rag_rerank_top_n=rag_rerank_top_n,
+        use_answer_cache=use_answer_cache,
     )
 
-    msgs = build_context_messages(db, conversation_id, user_id, new_content=content, model=model)
-
-    # RAG retrieval
-    try:
-        if settings.RAG_ENABLED:
-            kb_ids = crud_chat.list_conversation_kb_ids(db, conversation_id)
-            if kb_ids:
-                collections = []
-                for kb_id in kb_ids:
-                    kb = crud_kb.get_kb(db, kb_id, owner_id=user_id)
-                    if kb and kb.chroma_collection:
-                        collections.append({"kb_id": kb_id, "collection": kb.chroma_collection})
-                if collections:
-                    chunks = retrieve_collections(
-                        query_text=content,
-                        collections=collections,
-                        top_k=(rag_top_k or settings.RAG_TOP_K),
-                        per_kb_k=settings.RAG_PER_KB_K,
-                        use_rerank=(settings.RERANK_ENABLED if rag_use_rerank is None else bool(rag_use_rerank)),
-                        rerank_top_n=(rag_rerank_top_n or settings.RERANK_TOP_N),
-                    )
-                    if chunks:
-                        parts: List[str] = []
-                        used = 0
-                        for i, ch in enumerate(chunks, 1):
-                            t = (ch.get("text") or "").strip()
-                            if not t:
-                                continue
-                            t = t[:800]
-                            line = f"[{i}] {t}"
-                            if used + len(line) > settings.MAX_CONTEXT_CHARS:
-                                break
-                            parts.append(line)
-                            used += len(line)
-                        if parts:
-                            src = "\n".join(parts)
-                            sys_prompt = (
-                                "你是一个知识助手。以下是与用户问题相关的知识库片段：\n" + src +
-                                "\n请优先基于这些片段回答；若无法从中得到答案，请明确说明不确定。"
-                            )
-                            msgs.insert(0, {"role": "system", "content": sys_prompt})
-    except Exception:
-        logger.exception("[stream_chat] rag_inject_failed conv=%s", conversation_id)
-
     t0 = time.time()
     accumulated: List[str] = []
+    error: Optional[str] = None
 
     def yield_sse(data: str) -> str:
         return f"data: {data}\n\n"
 
-    # forward provider SSE lines
+    if probe is not None and probe.hit is not None:
+        try:
+            for payload_str in answer_cache.sse_payloads(probe):
+                yield yield_sse(payload_str)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(
+                    _persist_assistant,
+                    conversation_id,
+                    user_msg,
+                    content=probe.hit.get("answer"),
+                    model=(probe.hit.get("model") or model or settings.LLM_DEFAULT_MODEL),
+                    latency_ms=int((time.time() - t0) * 1000),
+                    retrieval_ms=stats.get("retrieval_ms"),
+                )
+            metrics.count_turn("stream", "cache_hit")
+            log_event(
+                logger, "[chat] turn_summary", mode="stream", conv=conversation_id,
+                model=(probe.hit.get("model") or model or settings.LLM_DEFAULT_MODEL),
+                answer_cache="hit", source_msg=probe.hit.get("message_id"), **stats,
+            )
+        yield yield_sse("[DONE]")
+        return
+
+    chunk_idx = 0
+    ttft_ms: Optional[int] = None
+    usage_line: Optional[str] = None
+    # set only once the provider stream ends normally; a client disconnect (CancelledError /
+    # GeneratorExit) skips both this and `except Exception`
+    completed = False
     try:
-        logger.info("[stream_chat] llm_stream_begin conv=%s", conversation_id)
-        chunk_idx = 0
-        for raw in llm_client.chat_completion_stream(
+        logger.debug("[astream_chat] llm_stream_begin conv=%s", conversation_id)
+        async for line in llm_client.achat_completion_stream(
             messages=msgs,
             model=model or settings.LLM_DEFAULT_MODEL,
             temperature=temperature,
             top_p=top_p,
             max_tokens=max_tokens or settings.LLM_MAX_TOKENS,
         ):
-            line = raw.decode("utf-8") if isinstance(raw, (bytes, bytearray)) else str(raw)
-            if not line:
+            if not line.startswith("data:"):
                 continue
-
-            # Provider usually sends lines starting with 'data:' and ends an event with a blank line.
-            # We normalize to our own SSE frame to guarantee '\n\n' separation.
-            if line.startswith("data:"):
-                payload_str = line[len("data:"):].strip()
-                logger.info(
-                    "[stream_chat] recv_chunk conv=%s idx=%s bytes=%s preview=%r",
-                    conversation_id,
-                    chunk_idx,
-                    len(payload_str),
-                    payload_str[:120],
-                )
-                # Forward normalized SSE frame to client
-                yield yield_sse(payload_str)
-                chunk_idx += 1
-
-                # Accumulate text from JSON payload
-                try:
-                    import json as _json
-                    if payload_str == "[DONE]":
-                        continue
-                    payload = _json.loads(payload_str)
-                    choice = (payload.get("choices") or [{}])[0]
-                    msg = choice.get("message") or {}
-                    delta = choice.get("delta") or {}
-                    piece = msg.get("content") or delta.get("content")
-                    if piece:
-                        accumulated.append(piece)
-                except Exception:
-                    # parsing errors are ignored but logged at debug
-                    logger.info("[stream_chat] chunk_parse_failed conv=%s", conversation_id)
-            else:
-                # Ignore non-data lines but keep a debug trace
-                logger.info("[stream_chat] ignore_line conv=%s line=%r", conversation_id, line[:80])
-
-        logger.info("[stream_chat] llm_stream_end conv=%s chunks=%s", conversation_id, chunk_idx)
+            if line.endswith("[DONE]"):
+                # our own [DONE] follows once the answer is persisted
+                continue
+            if _USAGE_KEY in line:
+                usage_line = line
+            try:
+                piece = _extract_piece(line)
+            except Exception:
+                piece = None
+                logger.debug("[astream_chat] chunk_parse_failed conv=%s", conversation_id)
+            if piece:
+                if ttft_ms is None:
+                    # first frame with text; role-only / empty leading deltas don't count
+                    ttft_ms = int((time.time() - t0) * 1000)
+                    metrics.observe_chat("llm_ttft", ttft_ms / 1000.0)
+                accumulated.append(piece)
+            # forward the provider frame unchanged
+            yield line + "\n\n"
+            log_event(logger, "[astream_chat] recv_chunk", conv=conversation_id, idx=chunk_idx, bytes=len(line))
+            chunk_idx += 1
+        logger.debug("[astream_chat] llm_stream_end conv=%s chunks=%s", conversation_id, chunk_idx)
+        completed = True
+    except Exception as e:
+        logger.exception("[astream_chat] llm_stream_failed conv=%s", conversation_id)
+        error = str(e)
     finally:
-        # persist assistant message
         latency_ms = int((time.time() - t0) * 1000)
+        metrics.observe_chat("llm_stream", latency_ms / 1000.0)
+        outcome = "ok" if completed else ("error" if error is not None else "cancelled")
+        metrics.count_turn("stream", outcome)
         content_out = "".join(accumulated) if accumulated else None
-        asst = crud_chat.add_message(
-            db,
-            conversation_id,
-            role="assistant",
-            content=content_out,
-            model=model or settings.LLM_DEFAULT_MODEL,
-            latency_ms=latency_ms,
-        )
-        logger.info(
-            "[stream_chat] assistant_persisted conv=%s msg_id=%s latency_ms=%s out_len=%s",
+        gen = _generation_fields(model, content_out, _stream_usage(usage_line), ttft_ms, latency_ms)
+        # shielded so the answer is still saved when the client disconnects mid-stream
+        with anyio.CancelScope(shield=True):
+            asst_id = await run_in_threadpool(
+                _persist_assistant,
+                conversation_id,
+                user_msg,
+                content=content_out,
+                model=model or settings.LLM_DEFAULT_MODEL,
+                latency_ms=latency_ms,
+                ttft_ms=ttft_ms,
+                retrieval_ms=stats.get("retrieval_ms"),
+                error=error,
+                **gen,
+            )
+            # only complete answers are cached; a partial one would be replayed to every
+            # near-duplicate question
+            if probe is not None and completed:
+                await run_in_threadpool(
+                    answer_cache.store,
+                    probe,
+                    content_out,
+                    model=model or settings.LLM_DEFAULT_MODEL,
+                    message_id=asst_id,
+                )
+        logger.debug(
+            "[astream_chat] assistant_persisted conv=%s msg_id=%s latency_ms=%s out_len=%s",
             conversation_id,
-            asst.id if asst else None,
+            asst_id,
             latency_ms,
             len(content_out) if content_out else 0,
         )
-
-        # 发送流式结束标记
-        logger.info("[stream_chat] sending_done_marker conv=%s", conversation_id)
-        yield yield_sse("[DONE]")
+        log_event(
+            logger, "[chat] turn_summary", mode="stream", conv=conversation_id,
+            model=(model or settings.LLM_DEFAULT_MODEL), llm_ms=latency_ms, ttft_ms=ttft_ms, chunks=chunk_idx,
+            out_len=len(content_out or ""), prompt_tokens=gen["tokens_prompt"],
+            completion_tokens=gen["tokens_completion"], tps=gen["tokens_per_second"],
+            outcome=outcome, **stats,
+        )
+    yield yield_sse("[DONE]")
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import logging
-from typing import List, Optional, Dict, Any
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Tuple
 
 import chromadb
 from chromadb.config import Settings as ChromaSettings
+from chromadb.errors import InvalidCollectionException
 
 from app.config.settings import settings
 
@@ -12,6 +15,10 @@ logger = logging.getLogger(__name__)
 
 _client: Optional[chromadb.HttpClient] = None
 
+# Bounded cache of collection handles so hot paths skip the get/create round trip.
+_collections: "OrderedDict[str, Any]" = OrderedDict()
+_collections_lock = threading.Lock()
+
 
 def get_client() -> chromadb.HttpClient:
     global _client
@@ -34,8 +41,51 @@ def get_client() -> chromadb.HttpClient:
     return _client
 
 
+def _cache_get(name: str):
+    with _collections_lock:
+        col = _collections.get(name)
+        if col is not None:
+            _collections.move_to_end(name)
+        return col
+
+
+def _cache_put(name: str, col) -> None:
+    with _collections_lock:
+        _collections[name] = col
+        _collections.move_to_end(name)
+        while len(_collections) > settings.CHROMA_COLLECTION_CACHE_SIZE:
+            _collections.popitem(last=False)
+
+
+def invalidate_collection(name: Optional[str] = None) -> None:
+    """Drop a cached handle (or all handles when name is None)."""
+    with _collections_lock:
+        if name is None:
+            _collections.clear()
+        else:
+            _collections.pop(name, None)
+
+
 def get_collection(name: str):
-    return get_client().get_or_create_collection(name)
+    """Read-only lookup; returns None if the collection does not exist (never creates it)."""
+    col = _cache_get(name)
+    if col is not None:
+        return col
+    try:
+        col = get_client().get_collection(name)
+    except (InvalidCollectionException, ValueError):
+        return None
+    _cache_put(name, col)
+    return col
+
+
+def get_or_create_collection(name: str):
+    col = _cache_get(name)
+    if col is not None:
+        return col
+    col = get_client().get_or_create_collection(name)
+    _cache_put(name, col)
+    return col
 
 
 def upsert_texts(
@@ -48,17 +98,88 @@ def upsert_texts(
 ):
     if not ids:
         return
-    col = get_collection(collection_name)
-    col.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+    col = get_or_create_collection(collection_name)
+    try:
+        col.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+    except Exception:
+        invalidate_collection(collection_name)
+        raise
     logger.info("[chroma_client] upsert collection=%s ids=%s", collection_name, len(ids))
 
 
+def get_chunks(collection_name: str, ids: List[str]) -> Dict[str, Tuple[str, List[float]]]:
+    """Fetch {id: (document, embedding)} for the ids that exist in the collection."""
+    col = get_collection(collection_name)
+    if col is None or not ids:
+        return {}
+    try:
+        resp = col.get(ids=ids, include=["documents", "embeddings"])
+    except Exception:
+        invalidate_collection(collection_name)
+        raise
+    docs = resp.get("documents")
+    embs = resp.get("embeddings")
+    if docs is None:
+        docs = []
+    if embs is None:
+        embs = []
+    return {
+        i: (d or "", list(e))
+        for i, d, e in zip(resp.get("ids") or [], docs, embs)
+    }
+
+
+def delete_ids(collection_name: str, ids: List[str]) -> None:
+    """Delete chunks by id in batches of CHROMA_DELETE_BATCH_SIZE (missing ids are ignored)."""
+    if not ids:
+        return
+    col = get_collection(collection_name)
+    if col is None:
+        return
+    batch = max(1, settings.CHROMA_DELETE_BATCH_SIZE)
+    try:
+        for i in range(0, len(ids), batch):
+            col.delete(ids=ids[i:i + batch])
+    except Exception:
+        invalidate_collection(collection_name)
+        raise
+    logger.info("[chroma_client] delete_ids collection=%s ids=%s", collection_name, len(ids))
+
+
+def chunk_ids(doc_uid: str, count: int, start: int = 0) -> List[str]:
+    """Deterministic chunk ids used when indexing a document: ``{uid}_{i}``."""
+    return [f"{doc_uid}_{i}" for i in range(start, start + count)]
+
+
+def delete_doc_chunks(collection_name: str, doc_uid: str, start: int = 0) -> None:
+    """Delete a document's chunks whose chunk_index is >= start (by metadata)."""
+    col = get_collection(collection_name)
+    if col is None:
+        return
+    where: Dict[str, Any] = {"doc_uid": doc_uid}
+    if start > 0:
+        where = {"$and": [where, {"chunk_index": {"$gte": int(start)}}]}
+    try:
+        col.delete(where=where)
+    except Exception:
+        invalidate_collection(collection_name)
+        raise
+
+
 def delete_by_doc_uid(collection_name: str, doc_uid: str) -> int:
+    """Delete all of a document's chunks and return how many were removed.
+
+    Ids are resolved from the ``doc_uid`` metadata rather than the stored chunk_count,
+    so chunks left beyond it (e.g. by an interrupted index run) are included.
+    """
     col = get_collection(collection_name)
-    # we persist doc_uid in metadatas for each chunk, so we can bulk delete by where filter
-    before = col.count()
-    col.delete(where={"doc_uid": doc_uid})
-    after = col.count()
-    deleted = max(0, before - after)
-    logger.info("[chroma_client] delete_by_doc_uid collection=%s uid=%s approx_deleted=%s", collection_name, doc_uid, deleted)
-    return deleted
+    if col is None:
+        return 0
+    try:
+        ids = col.get(where={"doc_uid": doc_uid}, include=[]).get("ids") or []
+    except Exception:
+        invalidate_collection(collection_name)
+        raise
+    delete_ids(collection_name, ids)
+    logger.info("[chroma_client] delete_by_doc_uid collection=%s uid=%s removed=%s", collection_name, doc_uid, len(ids))
+    return len(ids)
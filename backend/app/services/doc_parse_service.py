@@ -1,41 +1,46 @@
 from __future__ import annotations
 
 import os
-from typing import Optional
+from typing import Iterator, Optional
 
 from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 
 
-def _load_pdf(path: str) -> str:
-    docs = PyPDFLoader(path).load()
-    return "\n".join(d.page_content or "" for d in docs)
+def _iter_pdf(path: str) -> Iterator[str]:
+    # one page at a time so large PDFs are never fully materialized
+    for d in PyPDFLoader(path).lazy_load():
+        yield d.page_content or ""
 
 
-def _load_docx(path: str) -> str:
-    docs = Docx2txtLoader(path).load()
-    return "\n".join(d.page_content or "" for d in docs)
+def _iter_docx(path: str) -> Iterator[str]:
+    for d in Docx2txtLoader(path).lazy_load():
+        yield d.page_content or ""
 
 
-def _load_text(path: str) -> str:
+def _iter_text(path: str) -> Iterator[str]:
     # LangChain TextLoader handles encoding detection; fallback to utf-8
-    docs = TextLoader(path, autodetect_encoding=True).load()
-    return "\n".join(d.page_content or "" for d in docs)
+    for d in TextLoader(path, autodetect_encoding=True).lazy_load():
+        yield d.page_content or ""
 
 
-def parse_file(path: str, *, mime: Optional[str] = None, ext: Optional[str] = None, strategy: str = "auto") -> str:
-    """Parse a file to plain text using lightweight loaders.
-
-    strategy is reserved for future use; for now we auto-route by extension.
-    """
+def iter_file_sections(path: str, *, ext: Optional[str] = None, strategy: str = "auto") -> Iterator[str]:
+    """Yield a file's text section by section (pages for PDF, whole body otherwise)."""
     if ext is None:
         ext = os.path.splitext(path)[1].lstrip(".").lower()
 
     if ext == "pdf":
-        return _load_pdf(path)
+        return _iter_pdf(path)
     if ext in ("docx",):
-        return _load_docx(path)
+        return _iter_docx(path)
     if ext in ("txt", "md"):
-        return _load_text(path)
+        return _iter_text(path)
 
     raise ValueError(f"Unsupported file extension: .{ext}")
 
+
+def parse_file(path: str, *, mime: Optional[str] = None, ext: Optional[str] = None, strategy: str = "auto") -> str:
+    """Parse a file to plain text using lightweight loaders.
+
+    strategy is reserved for future use; for now we auto-route by extension.
+    """
+    return "\n".join(iter_file_sections(path, ext=ext, strategy=strategy))
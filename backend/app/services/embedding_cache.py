@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed cache for embedding vectors, keyed by (model, sha256(text)).
+# Vectors are stored as packed float32 to keep entries compact.
+
+
+def text_key(model: str, text: str) -> str:
+    digest = hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+def _pack(vec: List[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack(raw: bytes) -> List[float]:
+    a = array("f")
+    a.frombytes(raw)
+    return a.tolist()
+
+
+class _RedisStore:
+    """Redis-backed store with sliding TTL and an LRU bound kept by the store itself.
+
+    Last access times live in a sorted set; once it holds more than max_entries keys
+    the least recently used vectors are deleted, so the cache never depends on the
+    server's maxmemory-policy. Runs on its own logical DB (EMBEDDING_CACHE_REDIS_DB).
+    """
+
+    LRU_KEY = "emb:lru"
+
+    def __init__(self, ttl: int, max_entries: int, client=None):
+        if client is None:
+            from app.config.redis_config import make_redis_client
+
+            client = make_redis_client(settings.EMBEDDING_CACHE_REDIS_DB)
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _k(self, key: str) -> str:
+        return f"emb:{key}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        raws = self.client.mget([self._k(k) for k in keys])
+        out = {k: raw for k, raw in zip(keys, raws) if raw}
+        if out:
+            now = time.time()
+            pipe = self.client.pipeline(transaction=False)
+            pipe.zadd(self.LRU_KEY, {k: now for k in out})
+            if self.ttl:
+                # sliding TTL so frequently reused vectors stay resident
+                for k in out:
+                    pipe.expire(self._k(k), self.ttl)
+            pipe.execute()
+        return out
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        for k, raw in items.items():
+            pipe.set(self._k(k), raw, ex=(self.ttl or None))
+        pipe.zadd(self.LRU_KEY, {k: now for k in items})
+        if self.ttl:
+            # vectors that expired on their own
+            pipe.zremrangebyscore(self.LRU_KEY, "-inf", now - self.ttl)
+        pipe.zcard(self.LRU_KEY)
+        overflow = pipe.execute()[-1] - self.max_entries
+        if self.max_entries and overflow > 0:
+            evicted = [k.decode() if isinstance(k, bytes) else k
+                       for k, _ in self.client.zpopmin(self.LRU_KEY, overflow)]
+            if evicted:
+                self.client.delete(*[self._k(k) for k in evicted])
+
+
+class _DiskStore:
+    """SQLite-backed store with LRU (by last access) and TTL eviction."""
+
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vec BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_accessed ON embeddings(accessed)")
+        self.conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        now = time.time()
+        out: Dict[str, bytes] = {}
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self.conn.execute(
+                    f"SELECT key, vec, created FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, vec, created in rows:
+                    if self.ttl and now - created > self.ttl:
+                        continue
+                    out[key] = vec
+            if out:
+                self.conn.executemany(
+                    "UPDATE embeddings SET accessed=? WHERE key=?", [(now, k) for k in out]
+                )
+                self.conn.commit()
+        return out
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(key, vec, created, accessed) VALUES (?, ?, ?, ?)",
+                [(k, raw, now, now) for k, raw in items.items()],
+            )
+            if self.ttl:
+                self.conn.execute("DELETE FROM embeddings WHERE created < ?", (now - self.ttl,))
+            if self.max_entries:
+                (count,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+                overflow = count - self.max_entries
+                if overflow > 0:
+                    self.conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY accessed ASC LIMIT ?)",
+                        (overflow,),
+                    )
+            self.conn.commit()
+
+
+class EmbeddingCache:
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """Return {input_index: vector} for cached texts. Store errors count as misses."""
+        keys = [text_key(model, t) for t in texts]
+        try:
+            found = self.store.get_many(list(set(keys)))
+        except Exception:
+            logger.warning("[embedding_cache] get_failed model=%s n=%s", model, len(texts), exc_info=True)
+            found = {}
+        out = {i: _unpack(found[k]) for i, k in enumerate(keys) if k in found}
+        with self._lock:
+            self.hits += len(out)
+            self.misses += len(texts) - len(out)
+        return out
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        items = {text_key(model, t): _pack(v) for t, v in zip(texts, vectors) if v}
+        if not items:
+            return
+        try:
+            self.store.put_many(items)
+        except Exception:
+            logger.warning("[embedding_cache] put_failed model=%s n=%s", model, len(items), exc_info=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class QueryEmbeddingLRU:
+    """Bounded in-process LRU for query vectors, keyed by (model, normalized query)."""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, query)
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl and now - item[1] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, model: str, query: str, vec: List[float]) -> None:
+        if not vec:
+            return
+        with self._lock:
+            self._data[(model, query)] = (vec, time.monotonic())
+            self._data.move_to_end((model, query))
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+            }
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry."""
+    s = unicodedata.normalize("NFKC", text or "")
+    return " ".join(s.split())
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Return the configured embedding cache, or None when disabled."""
+    global _cache
+    backend = (settings.EMBEDDING_CACHE_BACKEND or "none").lower()
+    if backend == "none":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if backend == "redis":
+                    store = _RedisStore(
+                        ttl=settings.EMBEDDING_CACHE_TTL_SECONDS,
+                        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                    )
+                elif backend == "disk":
+                    path = settings.EMBEDDING_CACHE_PATH or os.path.join(
+                        settings.STORAGE_ROOT, "embedding_cache.sqlite3"
+                    )
+                    store = _DiskStore(
+                        path,
+                        ttl=settings.EMBEDDING_CACHE_TTL_SECONDS,
+                        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+                    )
+                else:
+                    raise ValueError(f"Unsupported EMBEDDING_CACHE_BACKEND: {backend}")
+                _cache = EmbeddingCache(store)
+                logger.info("[embedding_cache] enabled backend=%s", backend)
+    return _cache
+
+
+_query_lru: Optional[QueryEmbeddingLRU] = None
+
+
+def get_query_lru() -> Optional[QueryEmbeddingLRU]:
+    """Return the process-wide query embedding LRU, or None when disabled."""
+    global _query_lru
+    if settings.QUERY_EMBEDDING_CACHE_SIZE <= 0:
+        return None
+    if _query_lru is None:
+        with _cache_lock:
+            if _query_lru is None:
+                _query_lru = QueryEmbeddingLRU(
+                    max_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+                    ttl=settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+                )
+    return _query_lru
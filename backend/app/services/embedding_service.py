@@ -1,18 +1,121 @@
 from __future__ import annotations
 
+import time
 import logging
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 import httpx
 
 from app.config.settings import settings
+from app.services.embedding_cache import get_cache, get_query_lru, normalize_query
+from app.services.http_client import get_sync_client
 
 logger = logging.getLogger(__name__)
 
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
 
-def embed_texts(texts: List[str], model: str | None = None) -> List[List[float]]:
+
+def _split_batches(texts: List[str], max_items: int, max_chars: int) -> List[Tuple[int, List[str]]]:
+    """Split texts into (start_offset, batch) pairs bounded by item count and total chars.
+
+    A single text longer than max_chars still gets its own batch.
+    """
+    batches: List[Tuple[int, List[str]]] = []
+    start = 0
+    cur: List[str] = []
+    cur_chars = 0
+    for i, t in enumerate(texts):
+        n = len(t or "")
+        if cur and (len(cur) >= max_items or cur_chars + n > max_chars):
+            batches.append((start, cur))
+            start, cur, cur_chars = i, [], 0
+        cur.append(t)
+        cur_chars += n
+    if cur:
+        batches.append((start, cur))
+    return batches
+
+
+def _embed_batch(
+    texts: List[str], model_name: str, api_key: str, retries: int, timeout: float
+) -> List[List[float]]:
+    """Embed one batch, retrying transient failures with exponential backoff."""
+    url = f"https://api.siliconflow.cn/v1/embeddings"
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {"model": model_name, "input": texts}
+
+    attempts = max(1, retries + 1)
+    for attempt in range(1, attempts + 1):
+        try:
+            resp = get_sync_client().post(url, json=payload, headers=headers, timeout=timeout)
+            resp.raise_for_status()
+            data = resp.json()
+
+            # SiliconFlow compatibility: { data: [ { index, embedding: [...] }, ... ] }
+            items = data.get("data") or []
+            if items and all(isinstance(it.get("index"), int) for it in items):
+                items = sorted(items, key=lambda it: it["index"])
+            embeddings = [it.get("embedding") or [] for it in items]
+            if len(embeddings) != len(texts):
+                raise ValueError(f"embedding size mismatch in={len(texts)} out={len(embeddings)}")
+            return embeddings
+        except Exception as e:
+            retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in _RETRYABLE_STATUS
+            if not retryable or attempt >= attempts:
+                logger.error(
+                    "[embedding] batch_failed model=%s size=%s attempt=%s err=%s",
+                    model_name, len(texts), attempt, e,
+                )
+                raise
+            delay = settings.EMBEDDING_RETRY_BACKOFF * (2 ** (attempt - 1))
+            logger.warning(
+                "[embedding] batch_retry model=%s size=%s attempt=%s delay=%.2fs err=%s",
+                model_name, len(texts), attempt, delay, e,
+            )
+            time.sleep(delay)
+    return []  # unreachable
+
+
+def _embed_uncached(
+    texts: List[str], model_name: str, api_key: str, retries: int, timeout: float
+) -> List[List[float]]:
+    batches = _split_batches(
+        texts,
+        max(1, settings.EMBEDDING_BATCH_SIZE),
+        max(1, settings.EMBEDDING_BATCH_MAX_CHARS),
+    )
+    logger.info("[embedding] request model=%s inputs=%s batches=%s", model_name, len(texts), len(batches))
+
+    if len(batches) == 1:
+        return _embed_batch(batches[0][1], model_name, api_key, retries, timeout)
+    embeddings: List[List[float]] = [[] for _ in texts]
+    workers = max(1, min(settings.EMBEDDING_MAX_WORKERS, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as pool:
+        futures = [
+            (start, pool.submit(_embed_batch, batch, model_name, api_key, retries, timeout))
+            for start, batch in batches
+        ]
+        for start, fut in futures:
+            vecs = fut.result()
+            embeddings[start:start + len(vecs)] = vecs
+    return embeddings
+
+
+def embed_texts(
+    texts: List[str],
+    model: str | None = None,
+    *,
+    retries: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> List[List[float]]:
     """Call SiliconFlow embeddings API to generate vectors for a batch of texts.
 
+    Texts already present in the embedding cache (keyed by model + sha256 of the text)
+    are served from it; the rest are split into sub-batches (EMBEDDING_BATCH_SIZE /
+    EMBEDDING_BATCH_MAX_CHARS) that are dispatched concurrently and retried independently.
+    retries/timeout default to the indexing budget (EMBEDDING_MAX_RETRIES /
+    EMBEDDING_TIMEOUT_SECONDS) and apply per sub-batch.
     Returns a list of embedding vectors aligned with input order.
     """
     if not texts:
@@ -22,23 +125,58 @@ def embed_texts(texts: List[str], model: str | None = None) -> List[List[float]]
         raise ValueError("SILICONFLOW_API_KEY not configured for embeddings")
 
     model_name = model or settings.EMBEDDING_MODEL_DEFAULT
-    url = f"https://api.siliconflow.cn/v1/embeddings"
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {"model": model_name, "input": texts}
+    retries = settings.EMBEDDING_MAX_RETRIES if retries is None else retries
+    timeout = settings.EMBEDDING_TIMEOUT_SECONDS if timeout is None else timeout
+    cache = get_cache()
+    if cache is None:
+        return _embed_uncached(texts, model_name, api_key, retries, timeout)
+
+    embeddings: List[List[float]] = [[] for _ in texts]
+    cached = cache.get_many(model_name, texts)
+    for i, vec in cached.items():
+        embeddings[i] = vec
 
-    logger.info("[embedding] request model=%s batch=%s", model_name, len(texts))
-    with httpx.Client(timeout=60.0) as client:
-        resp = client.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
-
-    # SiliconFlow compatibility: { data: [ { embedding: [...] }, ... ] }
-    items = data.get("data") or []
-    embeddings: List[List[float]] = []
-    for it in items:
-        vec = it.get("embedding") or []
-        embeddings.append(vec)
-    if len(embeddings) != len(texts):
-        logger.warning("[embedding] size_mismatch in=%s out=%s", len(texts), len(embeddings))
+    # embed each distinct missing text once
+    pending: dict[str, List[int]] = {}
+    for i, t in enumerate(texts):
+        if i not in cached:
+            pending.setdefault(t, []).append(i)
+    if pending:
+        miss_texts = list(pending.keys())
+        vectors = _embed_uncached(miss_texts, model_name, api_key, retries, timeout)
+        cache.put_many(model_name, miss_texts, vectors)
+        for t, vec in zip(miss_texts, vectors):
+            for i in pending[t]:
+                embeddings[i] = vec
+    logger.info(
+        "[embedding] cache model=%s inputs=%s hits=%s embedded=%s",
+        model_name, len(texts), len(cached), len(pending),
+    )
     return embeddings
 
+
+def embed_query(text: str, model: str | None = None) -> List[float]:
+    """Embed a single retrieval query.
+
+    Served from the in-process query LRU when possible; misses fall through to
+    embed_texts, which consults the shared (Redis/disk) embedding cache as a second tier.
+    A chat turn waits on this, so it gets the short EMBEDDING_QUERY_* budget instead of
+    the indexing one.
+    """
+    model_name = model or settings.EMBEDDING_MODEL_DEFAULT
+    query = normalize_query(text)
+    lru = get_query_lru()
+    if lru is not None:
+        vec = lru.get(model_name, query)
+        if vec is not None:
+            return vec
+    vectors = embed_texts(
+        [query],
+        model=model_name,
+        retries=settings.EMBEDDING_QUERY_MAX_RETRIES,
+        timeout=settings.EMBEDDING_QUERY_TIMEOUT_SECONDS,
+    )
+    vec = vectors[0] if vectors else []
+    if lru is not None:
+        lru.put(model_name, query, vec)
+    return vec
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Optional
+
+import httpx
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Process-wide pooled clients shared by embedding / rerank / LLM services.
+# Reusing them keeps TCP+TLS connections to the provider alive across calls.
+_sync_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _http2_enabled() -> bool:
+    if not settings.HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401  (optional dependency of httpx[http2])
+    except ImportError:
+        logger.warning("[http_client] http2 requested but 'h2' is not installed; falling back to HTTP/1.1")
+        return False
+    return True
+
+
+def _timeout() -> httpx.Timeout:
+    # Callers pass their own per-request timeout; this is only the default.
+    return httpx.Timeout(settings.HTTP_DEFAULT_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+
+def get_sync_client() -> httpx.Client:
+    """Return the shared blocking client, creating it on first use."""
+    global _sync_client
+    if _sync_client is None or _sync_client.is_closed:
+        with _lock:
+            if _sync_client is None or _sync_client.is_closed:
+                http2 = _http2_enabled()
+                _sync_client = httpx.Client(limits=_limits(), timeout=_timeout(), http2=http2)
+                logger.info(
+                    "[http_client] sync_client_created max_conn=%s keepalive=%s http2=%s",
+                    settings.HTTP_MAX_CONNECTIONS,
+                    settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    http2,
+                )
+    return _sync_client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the shared async client, creating it on first use.
+
+    Must be called from within the running event loop (FastAPI startup does this).
+    """
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        http2 = _http2_enabled()
+        _async_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout(), http2=http2)
+        logger.info(
+            "[http_client] async_client_created max_conn=%s keepalive=%s http2=%s",
+            settings.HTTP_MAX_CONNECTIONS,
+            settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            http2,
+        )
+    return _async_client
+
+
+async def startup() -> None:
+    get_sync_client()
+    get_async_client()
+
+
+async def shutdown() -> None:
+    global _sync_client, _async_client
+    with _lock:
+        client, _sync_client = _sync_client, None
+    if client is not None:
+        try:
+            client.close()
+        except Exception:
+            logger.debug("[http_client] sync_close_failed")
+    aclient, _async_client = _async_client, None
+    if aclient is not None:
+        try:
+            await aclient.aclose()
+        except Exception:
+            logger.debug("[http_client] async_close_failed")
+    logger.info("[http_client] closed")
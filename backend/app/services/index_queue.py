@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import json
+import time
+import uuid as uuidlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from fastapi import BackgroundTasks
+from redis.exceptions import WatchError
+
+from app.config.redis_config import get_redis_client
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Reliable Redis queue for document indexing jobs.
+#   QUEUE_KEY       list of pending jobs (LPUSH / BRPOPLPUSH)
+#   PROCESSING_KEY  list of jobs currently held by a worker
+#   LEASES_KEY      zset job -> lease deadline; expired leases are put back on the queue.
+#                   A PROCESSING entry without a lease (claimer died right after
+#                   BRPOPLPUSH) is leased by requeue_expired so it expires like any other
+#   DELAYED_KEY     zset job -> not-before time for failed jobs waiting out their backoff;
+#                   due jobs are moved back to QUEUE_KEY by claim/requeue_expired
+#   PENDING_KEY     set of doc ids waiting in QUEUE_KEY or DELAYED_KEY, used to skip
+#                   duplicate enqueues. Always written in the same MULTI as the job itself
+QUEUE_KEY = "index:queue"
+PROCESSING_KEY = "index:processing"
+LEASES_KEY = "index:leases"
+DELAYED_KEY = "index:delayed"
+PENDING_KEY = "index:pending_docs"
+
+
+def _job(kb_id: int, doc_id: int, owner_id: int, attempts: int = 0) -> Dict[str, Any]:
+    return {
+        "id": str(uuidlib.uuid4()),
+        "kb_id": int(kb_id),
+        "doc_id": int(doc_id),
+        "owner_id": int(owner_id),
+        "attempts": int(attempts),
+        "enqueued_at": time.time(),
+    }
+
+
+def _push(r, kb_id: int, doc_id: int, owner_id: int, attempts: int, not_before: float = 0.0, ack: Optional[bytes] = None) -> bool:
+    """Add a job and its pending marker in one MULTI, unless the doc is already pending.
+
+    With not_before the job goes to DELAYED_KEY instead of the queue; with ack the
+    given PROCESSING entry is acknowledged in the same transaction.
+    """
+    raw = json.dumps(_job(kb_id, doc_id, owner_id, attempts))
+
+    def _txn(pipe) -> bool:
+        pending = pipe.sismember(PENDING_KEY, int(doc_id))
+        pipe.multi()
+        if ack is not None:
+            pipe.lrem(PROCESSING_KEY, 1, ack)
+            pipe.zrem(LEASES_KEY, ack)
+        if pending:
+            return False
+        pipe.sadd(PENDING_KEY, int(doc_id))
+        if not_before:
+            pipe.zadd(DELAYED_KEY, {raw: not_before})
+        else:
+            pipe.lpush(QUEUE_KEY, raw)
+        return True
+
+    return r.transaction(_txn, PENDING_KEY, value_from_callable=True)
+
+
+def enqueue(kb_id: int, doc_id: int, owner_id: int, *, attempts: int = 0) -> bool:
+    """Push an index job. Returns False if the document is already waiting in the queue."""
+    if not _push(get_redis_client(), kb_id, doc_id, owner_id, attempts):
+        logger.info("[index_queue] already_queued kb=%s doc=%s", kb_id, doc_id)
+        return False
+    logger.info("[index_queue] enqueued kb=%s doc=%s attempts=%s", kb_id, doc_id, attempts)
+    return True
+
+
+def schedule_index(background_tasks: Optional[BackgroundTasks], kb_id: int, doc_id: int, owner_id: int) -> None:
+    """Hand a document to the indexing queue, or to in-process BackgroundTasks if the
+    queue is disabled or Redis is unreachable."""
+    if settings.INDEX_QUEUE_ENABLED:
+        try:
+            enqueue(kb_id, doc_id, owner_id)
+            return
+        except Exception:
+            logger.warning("[index_queue] enqueue_failed kb=%s doc=%s; falling back to in-process", kb_id, doc_id)
+    if background_tasks is not None:
+        from app.services.index_service import index_document_background
+
+        background_tasks.add_task(index_document_background, kb_id, doc_id, owner_id)
+
+
+def claim(timeout: int) -> Optional[Dict[str, Any]]:
+    """Block up to timeout seconds for a job and lease it to the caller."""
+    r = get_redis_client()
+    promote_due(r)
+    # BRPOPLPUSH cannot run inside MULTI/Lua, so the move and the lease are two steps;
+    # _lease_orphans covers a worker dying between them
+    raw = r.brpoplpush(QUEUE_KEY, PROCESSING_KEY, timeout=timeout)
+    if raw is None:
+        return None
+    try:
+        job = json.loads(raw)
+    except Exception:
+        logger.error("[index_queue] bad_job dropped raw=%r", raw[:200])
+        ack_raw(raw)
+        return None
+    pipe = r.pipeline()
+    pipe.zadd(LEASES_KEY, {raw: time.time() + settings.INDEX_QUEUE_VISIBILITY_TIMEOUT})
+    pipe.srem(PENDING_KEY, job.get("doc_id"))
+    pipe.execute()
+    job["_raw"] = raw
+    return job
+
+
+def extend(job: Dict[str, Any]) -> None:
+    get_redis_client().zadd(
+        LEASES_KEY, {job["_raw"]: time.time() + settings.INDEX_QUEUE_VISIBILITY_TIMEOUT}, xx=True
+    )
+
+
+def ack_raw(raw: bytes) -> None:
+    r = get_redis_client()
+    pipe = r.pipeline()
+    pipe.lrem(PROCESSING_KEY, 1, raw)
+    pipe.zrem(LEASES_KEY, raw)
+    pipe.execute()
+
+
+def ack(job: Dict[str, Any]) -> None:
+    ack_raw(job["_raw"])
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before retry number `attempts` (1-based), doubling each time."""
+    return settings.INDEX_QUEUE_RETRY_DELAY_SECONDS * (2 ** max(0, attempts - 1))
+
+
+def retry(job: Dict[str, Any]) -> bool:
+    """Schedule a failed job again after a backoff, unless it has used up
+    INDEX_QUEUE_MAX_ATTEMPTS. The ack and the reschedule are one transaction."""
+    attempts = int(job.get("attempts") or 0) + 1
+    if attempts >= settings.INDEX_QUEUE_MAX_ATTEMPTS:
+        ack(job)
+        logger.warning("[index_queue] giving_up kb=%s doc=%s attempts=%s", job["kb_id"], job["doc_id"], attempts)
+        return False
+    delay = retry_delay(attempts)
+    ok = _push(
+        get_redis_client(), job["kb_id"], job["doc_id"], job["owner_id"], attempts,
+        not_before=time.time() + delay, ack=job["_raw"],
+    )
+    logger.info(
+        "[index_queue] retry_scheduled kb=%s doc=%s attempts=%s delay_s=%s queued=%s",
+        job["kb_id"], job["doc_id"], attempts, delay, ok,
+    )
+    return ok
+
+
+def promote_due(r=None) -> int:
+    """Move delayed jobs whose backoff has passed back onto the queue."""
+    r = r or get_redis_client()
+
+    def _txn(pipe) -> int:
+        due = pipe.zrangebyscore(DELAYED_KEY, "-inf", time.time(), start=0, num=100)
+        if not due:
+            return 0
+        pipe.multi()
+        pipe.zrem(DELAYED_KEY, *due)
+        pipe.lpush(QUEUE_KEY, *due)
+        return len(due)
+
+    moved = r.transaction(_txn, DELAYED_KEY, value_from_callable=True)
+    if moved:
+        logger.info("[index_queue] delayed_promoted n=%s", moved)
+    return moved
+
+
+def _lease_orphans(r) -> List[bytes]:
+    """Lease PROCESSING entries that have none, atomically w.r.t. ack (WATCH/MULTI).
+
+    Their pending marker is cleared too, so the requeue after expiry is not skipped as
+    a duplicate.
+    """
+    for _ in range(3):
+        with r.pipeline() as pipe:
+            try:
+                pipe.watch(PROCESSING_KEY, LEASES_KEY)
+                orphans = [
+                    raw for raw in pipe.lrange(PROCESSING_KEY, 0, -1)
+                    if pipe.zscore(LEASES_KEY, raw) is None
+                ]
+                if not orphans:
+                    return []
+                pipe.multi()
+                deadline = time.time() + settings.INDEX_QUEUE_VISIBILITY_TIMEOUT
+                pipe.zadd(LEASES_KEY, {raw: deadline for raw in orphans})
+                pipe.execute()
+            except WatchError:
+                continue
+        for raw in orphans:
+            try:
+                doc_id = json.loads(raw).get("doc_id")
+            except Exception:
+                continue
+            r.srem(PENDING_KEY, doc_id)
+            logger.warning("[index_queue] orphan_leased doc=%s", doc_id)
+        return orphans
+    return []
+
+
+def requeue_expired() -> int:
+    """Put jobs whose lease expired (worker died or hung) back on the queue."""
+    r = get_redis_client()
+    promote_due(r)
+    _lease_orphans(r)
+    expired = r.zrangebyscore(LEASES_KEY, "-inf", time.time())
+    moved = 0
+    for raw in expired:
+        # only the caller that wins the ZREM requeues it
+        if not r.zrem(LEASES_KEY, raw):
+            continue
+        r.lrem(PROCESSING_KEY, 1, raw)
+        try:
+            job = json.loads(raw)
+        except Exception:
+            continue
+        logger.warning("[index_queue] lease_expired kb=%s doc=%s", job.get("kb_id"), job.get("doc_id"))
+        attempts = int(job.get("attempts") or 0) + 1
+        if attempts < settings.INDEX_QUEUE_MAX_ATTEMPTS:
+            enqueue(job["kb_id"], job["doc_id"], job["owner_id"], attempts=attempts)
+            moved += 1
+    return moved
+
+
+def tracked_doc_ids() -> set[int]:
+    """Doc ids that are queued or currently leased."""
+    r = get_redis_client()
+    ids = {int(x) for x in r.smembers(PENDING_KEY)}
+    for raw in r.lrange(PROCESSING_KEY, 0, -1):
+        try:
+            ids.add(int(json.loads(raw)["doc_id"]))
+        except Exception:
+            continue
+    return ids
+
+
+def recover_stuck(db) -> List[int]:
+    """Re-enqueue documents left in status 'processing' that no job is tracking."""
+    from app.crud import crud_kb_document
+
+    tracked = tracked_doc_ids()
+    recovered: List[int] = []
+    for doc, owner_id in crud_kb_document.list_documents_by_status(db, "processing"):
+        if doc.id in tracked:
+            continue
+        if enqueue(doc.kb_id, doc.id, owner_id):
+            recovered.append(doc.id)
+    if recovered:
+        logger.info("[index_queue] recovered_stuck docs=%s", recovered)
+    return recovered
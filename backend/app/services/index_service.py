@@ -1,8 +1,12 @@
 from __future__ import annotations
 
 import json
+import time
+import queue
+import hashlib
 import logging
-from typing import Optional, Dict, Any, List
+import threading
+from typing import Callable, Iterable, Optional, Dict, Any, List, Tuple
 from datetime import datetime
 
 from sqlalchemy.orm import Session
@@ -10,9 +14,10 @@ from sqlalchemy.orm import Session
 from app.config.mysql_config import SessionLocal
 from app.config.settings import settings
 from app.crud import crud_kb, crud_kb_document
-from app.services import chroma_client
-from app.services.doc_parse_service import parse_file
-from app.services.text_chunker import chunk_text
+from app.models.knowledge import KnowledgeBase, KnowledgeDocument
+from app.services import answer_cache, chroma_client, lexical_index, metrics
+from app.services.doc_parse_service import iter_file_sections
+from app.services.text_chunker import iter_chunks
 from app.services.embedding_service import embed_texts
 
 logger = logging.getLogger(__name__)
@@ -25,54 +30,326 @@ def _json_load(s: Optional[str]) -> Dict[str, Any]:
         return {}
 
 
+_END = object()
+
+
+def _chunk_hash(model: str, text: str) -> str:
+    """Per-chunk content hash persisted on the document; includes the embedding model so a
+    model change invalidates every chunk."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _load_hashes(raw: Optional[str]) -> List[str]:
+    try:
+        out = json.loads(raw or "[]")
+    except Exception:
+        return []
+    return out if isinstance(out, list) else []
+
+
+def _ingest_settings(doc: KnowledgeDocument, kb: KnowledgeBase) -> Dict[str, Any]:
+    """Resolve a document's effective ingest parameters (overrides, then KB, then defaults)."""
+    ingest = _json_load(getattr(doc, "ingest_params", None))
+    return {
+        "chunk_size": int(ingest.get("chunk_size") or settings.CHUNK_SIZE_DEFAULT),
+        "chunk_overlap": int(ingest.get("overlap") or settings.CHUNK_OVERLAP_DEFAULT),
+        "parse_strategy": (ingest.get("parse_strategy") or settings.PARSE_STRATEGY_DEFAULT),
+        "embedding_model": ingest.get("embedding_model") or kb.embedding_model or settings.EMBEDDING_MODEL_DEFAULT,
+    }
+
+
+def _find_clone_source(
+    db: Session, doc: KnowledgeDocument, kb: KnowledgeBase, params: Dict[str, Any]
+) -> Optional[Tuple[KnowledgeDocument, KnowledgeBase]]:
+    """Find a processed copy of the same file indexed with identical parameters."""
+    if not doc.content_sha256:
+        return None
+    candidates = crud_kb_document.list_processed_by_sha256(
+        db,
+        doc.content_sha256,
+        embedding_model=params["embedding_model"],
+        exclude_doc_id=doc.id,
+        prefer_kb_id=kb.id,
+    )
+    for src, src_kb in candidates:
+        if _ingest_settings(src, src_kb) != params:
+            continue
+        if len(_load_hashes(src.chunk_hashes)) != int(src.chunk_count or 0):
+            continue
+        return src, src_kb
+    return None
+
+
+def _clone_chunks(src: KnowledgeDocument, src_kb: KnowledgeBase, doc: KnowledgeDocument, kb: KnowledgeBase) -> bool:
+    """Copy a source document's chunk texts and vectors under this document's ids.
+
+    Returns False (nothing written) if any source chunk is missing from Chroma.
+    """
+    count = int(src.chunk_count or 0)
+    batch = max(1, settings.INDEX_PIPELINE_BATCH_SIZE)
+    for start in range(0, count, batch):
+        n = min(batch, count - start)
+        src_ids = chroma_client.chunk_ids(src.uid, n, start=start)
+        found = chroma_client.get_chunks(src_kb.chroma_collection, src_ids)
+        if len(found) != n:
+            logger.warning(
+                "[index] clone_source_incomplete src=%s expected=%s found=%s", src.id, n, len(found)
+            )
+            return False
+        ids = chroma_client.chunk_ids(doc.uid, n, start=start)
+        texts = [found[i][0] for i in src_ids]
+        metadatas = [
+            {
+                "kb_id": kb.id,
+                "doc_id": doc.id,
+                "doc_uid": doc.uid,
+                "chunk_index": start + i,
+                "filename": doc.filename,
+            }
+            for i in range(n)
+        ]
+        chroma_client.upsert_texts(
+            kb.chroma_collection,
+            ids=ids,
+            texts=texts,
+            metadatas=metadatas,
+            embeddings=[found[i][1] for i in src_ids],
+        )
+        lexical_index.upsert_chunks(kb.chroma_collection, ids, texts, metadatas)
+    return True
+
+
+def _delete_tail(collection: str, doc_uid: str, start: int) -> None:
+    """Remove a document's chunks with chunk_index >= start (vector and BM25 index)."""
+    with metrics.index_timer("delete_tail"):
+        chroma_client.delete_doc_chunks(collection, doc_uid, start=start)
+        lexical_index.delete_doc(collection, doc_uid, start=start)
+
+
+def _run_pipeline(
+    chunks: Iterable[str],
+    *,
+    embedding_model: str,
+    on_batch: Callable[[int, List[str], List[Optional[List[float]]]], None],
+    skip: Optional[Callable[[int, str], bool]] = None,
+) -> int:
+    """Stream chunks through embedding into on_batch with bounded queues.
+
+    Parsing/chunking and embedding each run on their own thread while the caller's
+    thread runs on_batch (Chroma upsert + progress), so network and CPU work overlap and
+    at most INDEX_PIPELINE_QUEUE_SIZE batches are held per stage. Batches reach
+    on_batch in document order. Chunks for which skip(index, text) is true are not
+    embedded and reach on_batch with a None vector. Returns the number of chunks processed.
+    """
+    batch_size = max(1, settings.INDEX_PIPELINE_BATCH_SIZE)
+    chunk_q: "queue.Queue" = queue.Queue(maxsize=max(1, settings.INDEX_PIPELINE_QUEUE_SIZE))
+    vec_q: "queue.Queue" = queue.Queue(maxsize=max(1, settings.INDEX_PIPELINE_QUEUE_SIZE))
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def _put(q: "queue.Queue", item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(q: "queue.Queue"):
+        while True:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                if stop.is_set():
+                    return _END
+
+    def _fail(e: BaseException) -> None:
+        errors.append(e)
+        stop.set()
+
+    def produce() -> None:
+        try:
+            start, batch = 0, []
+            t = time.perf_counter()
+            # chunks is lazy: time spent pulling a batch is parse + chunk time
+            for ch in chunks:
+                batch.append(ch)
+                if len(batch) >= batch_size:
+                    metrics.observe_index("parse_batch", time.perf_counter() - t)
+                    if not _put(chunk_q, (start, batch)):
+                        return
+                    start, batch = start + len(batch), []
+                    t = time.perf_counter()
+            if batch:
+                metrics.observe_index("parse_batch", time.perf_counter() - t)
+                if not _put(chunk_q, (start, batch)):
+                    return
+            _put(chunk_q, _END)
+        except BaseException as e:
+            _fail(e)
+
+    def embed() -> None:
+        try:
+            while True:
+                item = _get(chunk_q)
+                if item is _END:
+                    _put(vec_q, _END)
+                    return
+                start, texts = item
+                todo = [i for i, t in enumerate(texts) if not (skip and skip(start + i, t))]
+                vectors: List[Optional[List[float]]] = [None] * len(texts)
+                metrics.count_chunks("skipped", len(texts) - len(todo))
+                if todo:
+                    with metrics.index_timer("embed_batch"):
+                        embedded = embed_texts([texts[i] for i in todo], model=embedding_model)
+                    if not embedded or len(embedded) != len(todo):
+                        raise ValueError("Embedding failed or size mismatch")
+                    for i, vec in zip(todo, embedded):
+                        vectors[i] = vec
+                    metrics.count_chunks("embedded", len(todo))
+                if not _put(vec_q, (start, texts, vectors)):
+                    return
+        except BaseException as e:
+            _fail(e)
+
+    threads = [
+        threading.Thread(target=produce, name="index-parse", daemon=True),
+        threading.Thread(target=embed, name="index-embed", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+    total = 0
+    try:
+        while True:
+            item = _get(vec_q)
+            if item is _END:
+                break
+            start, texts, vectors = item
+            on_batch(start, texts, vectors)
+            total = start + len(texts)
+    except BaseException as e:
+        _fail(e)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+    return total
+
+
 def index_document(
     db: Session,
     kb_id: int,
     doc_id: int,
     owner_id: int,
-) -> None:
+) -> bool:
+    """Parse, chunk, embed and upsert a document.
+
+    Returns False if indexing failed (the document is marked failed and may be retried).
+    """
     kb = crud_kb.get_kb(db, kb_id, owner_id)
     if not kb:
         logger.warning("[index] kb_not_found kb=%s owner=%s", kb_id, owner_id)
-        return
+        return True
     doc = crud_kb_document.get_document(db, kb_id, doc_id, owner_id)
     if not doc:
         logger.warning("[index] doc_not_found kb=%s doc=%s", kb_id, doc_id)
-        return
+        return True
 
-    ingest = _json_load(getattr(doc, "ingest_params", None))
-    chunk_size = int(ingest.get("chunk_size") or settings.CHUNK_SIZE_DEFAULT)
-    chunk_overlap = int(ingest.get("overlap") or settings.CHUNK_OVERLAP_DEFAULT)
-    parse_strategy = (ingest.get("parse_strategy") or settings.PARSE_STRATEGY_DEFAULT)
-    embedding_model = ingest.get("embedding_model") or kb.embedding_model or settings.EMBEDDING_MODEL_DEFAULT
+    params = _ingest_settings(doc, kb)
+    chunk_size = params["chunk_size"]
+    chunk_overlap = params["chunk_overlap"]
+    parse_strategy = params["parse_strategy"]
+    embedding_model = params["embedding_model"]
 
     # Resolve file path
     path = doc.storage_uri or ""
+    # Incremental reindex: chunks whose (model, text) hash matches the stored hash at the
+    # same position are already in Chroma and are skipped; chunks past the new end are
+    # deleted once the run succeeds. chunk_count is only written then, so it always
+    # describes a complete index; chunks_indexed tracks the run in progress.
+    old_hashes = _load_hashes(getattr(doc, "chunk_hashes", None))
+    new_hashes: List[str] = []
+    written = 0
+    batches = 0
+    progress_every = max(0, settings.INDEX_PROGRESS_EVERY_BATCHES)
+
+    def unchanged(i: int, text: str) -> bool:
+        return i < len(old_hashes) and old_hashes[i] == _chunk_hash(embedding_model, text)
+
+    t_start = time.perf_counter()
+    crud_kb_document.update_document_status(db, doc_id=doc.id, chunks_indexed=0)
     try:
-        # parse
-        text = parse_file(path, ext=(doc.file_ext or None), strategy=parse_strategy)
-        chunks = chunk_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        if not chunks:
-            raise ValueError("No content after parsing and chunking")
+        # identical file already indexed with the same parameters: copy its vectors
+        source = _find_clone_source(db, doc, kb, params)
+        cloned = False
+        if source:
+            with metrics.index_timer("clone"):
+                cloned = _clone_chunks(source[0], source[1], doc, kb)
+        if cloned:
+            src = source[0]
+            total = int(src.chunk_count)
+            _delete_tail(kb.chroma_collection, doc.uid, total)
+            crud_kb_document.update_document_status(
+                db,
+                doc_id=doc.id,
+                status="processed",
+                error=None,
+                chunk_count=total,
+                chunks_indexed=total,
+                chunk_hashes=src.chunk_hashes,
+                embedding_model=embedding_model,
+                processed_at=datetime.utcnow(),
+            )
+            logger.info("[index] cloned kb=%s doc=%s from_doc=%s chunks=%s", kb_id, doc_id, src.id, total)
+            metrics.count_index("cloned")
+            metrics.observe_index("document", time.perf_counter() - t_start)
+            return True
 
-        # embed
-        vectors = embed_texts(chunks, model=embedding_model)
-        if not vectors or len(vectors) != len(chunks):
-            raise ValueError("Embedding failed or size mismatch")
+        sections = iter_file_sections(path, ext=(doc.file_ext or None), strategy=parse_strategy)
+        chunks = iter_chunks(sections, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
 
-        # upsert to chroma
-        ids = [f"{doc.uid}_{i}" for i in range(len(chunks))]
-        metas: List[Dict[str, Any]] = [
-            {
-                "kb_id": kb_id,
-                "doc_id": doc.id,
-                "doc_uid": doc.uid,
-                "chunk_index": i,
-                "filename": doc.filename,
-            }
-            for i in range(len(chunks))
-        ]
-        chroma_client.upsert_texts(kb.chroma_collection, ids=ids, texts=chunks, metadatas=metas, embeddings=vectors)
+        def upsert_batch(start: int, texts: List[str], vectors: List[Optional[List[float]]]) -> None:
+            nonlocal written, batches
+            new_hashes.extend(_chunk_hash(embedding_model, t) for t in texts)
+            ids = chroma_client.chunk_ids(doc.uid, len(texts), start=start)
+            metadatas = [
+                {
+                    "kb_id": kb_id,
+                    "doc_id": doc.id,
+                    "doc_uid": doc.uid,
+                    "chunk_index": start + i,
+                    "filename": doc.filename,
+                }
+                for i in range(len(texts))
+            ]
+            # the BM25 index is rewritten for every chunk (no embedding cost), so documents
+            # indexed before it existed are picked up by a plain reindex
+            with metrics.index_timer("lexical_upsert"):
+                lexical_index.upsert_chunks(kb.chroma_collection, ids, texts, metadatas)
+            changed = [i for i, v in enumerate(vectors) if v is not None]
+            if changed:
+                with metrics.index_timer("upsert_batch"):
+                    chroma_client.upsert_texts(
+                        kb.chroma_collection,
+                        ids=[ids[i] for i in changed],
+                        texts=[texts[i] for i in changed],
+                        metadatas=[metadatas[i] for i in changed],
+                        embeddings=[vectors[i] for i in changed],
+                    )
+                written += len(changed)
+            batches += 1
+            if progress_every and batches % progress_every == 0:
+                crud_kb_document.update_document_status(db, doc_id=doc.id, chunks_indexed=start + len(texts))
+
+        total = _run_pipeline(chunks, embedding_model=embedding_model, on_batch=upsert_batch, skip=unchanged)
+        if not total:
+            raise ValueError("No content after parsing and chunking")
+
+        # drop chunks that no longer exist, including any left by an interrupted run
+        _delete_tail(kb.chroma_collection, doc.uid, total)
 
         # update db
         crud_kb_document.update_document_status(
@@ -80,18 +357,36 @@ def index_document(
             doc_id=doc.id,
             status="processed",
             error=None,
-            chunk_count=len(chunks),
+            chunk_count=total,
+            chunks_indexed=total,
+            chunk_hashes=json.dumps(new_hashes),
+            embedding_model=embedding_model,
             processed_at=datetime.utcnow(),
         )
-        logger.info("[index] done kb=%s doc=%s chunks=%s", kb_id, doc_id, len(chunks))
+        logger.info(
+            "[index] done kb=%s doc=%s chunks=%s upserted=%s",
+            kb_id, doc_id, total, written,
+        )
+        metrics.count_index("processed")
+        metrics.observe_index("document", time.perf_counter() - t_start)
+        return True
     except Exception as e:
         logger.exception("[index] failed kb=%s doc=%s", kb_id, doc_id)
+        metrics.count_index("failed")
+        # some positions may hold new content now; forget stored hashes so the next
+        # attempt rewrites every chunk
         crud_kb_document.update_document_status(
             db,
             doc_id=doc_id,
             status="failed",
             error=str(e),
+            chunks_indexed=0,
+            chunk_hashes="[]",
         )
+        return False
+    finally:
+        # vectors may have changed either way
+        answer_cache.bump_kb_version(kb_id)
 
 
 def index_document_background(kb_id: int, doc_id: int, owner_id: int) -> None:
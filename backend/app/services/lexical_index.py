@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Sequence
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Per-KB BM25 index stored as a local SQLite FTS5 database, one file per Chroma collection
+# under LEXICAL_INDEX_DIR. Text is pre-tokenized here (lower-cased words/identifiers,
+# overlapping bigrams for CJK runs) and joined with spaces, so FTS5 only splits on
+# whitespace-like separators and ranks with its built-in bm25().
+#   chunks      fts5(tokens, text UNINDEXED)
+#   chunk_rows  chunk_id -> fts rowid, with doc_uid/chunk_index/filename for results
+
+_TOKEN_RE = re.compile(
+    r"[a-z0-9]+(?:[._\-/:][a-z0-9]+)*"  # words, versions, error codes, paths
+    r"|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+"  # CJK runs
+)
+_CJK_START = "\u3040"
+_MAX_QUERY_TERMS = 32
+
+_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+    " tokens, text UNINDEXED, tokenize=\"unicode61 tokenchars '._-/:'\")",
+    "CREATE TABLE IF NOT EXISTS chunk_rows ("
+    " chunk_id TEXT PRIMARY KEY, row INTEGER NOT NULL, doc_id INTEGER, doc_uid TEXT,"
+    " chunk_index INTEGER, filename TEXT)",
+    "CREATE INDEX IF NOT EXISTS ix_chunk_rows_doc_uid ON chunk_rows(doc_uid)",
+    "CREATE INDEX IF NOT EXISTS ix_chunk_rows_row ON chunk_rows(row)",
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens plus character bigrams for CJK runs."""
+    out: List[str] = []
+    for m in _TOKEN_RE.finditer((text or "").lower()):
+        tok = m.group(0)
+        if tok[0] < _CJK_START:
+            out.append(tok)
+        elif len(tok) == 1:
+            out.append(tok)
+        else:
+            out.extend(tok[i:i + 2] for i in range(len(tok) - 1))
+    return out
+
+
+_conns: Dict[str, sqlite3.Connection] = {}
+_locks: Dict[str, threading.Lock] = {}
+_conns_lock = threading.Lock()
+
+
+def _path(collection: str) -> str:
+    root = settings.LEXICAL_INDEX_DIR or os.path.join(settings.STORAGE_ROOT, "lexical")
+    return os.path.join(root, f"{collection}.sqlite3")
+
+
+def _open(collection: str, create: bool):
+    """Return (connection, lock) for a collection's index, or None if it does not exist."""
+    with _conns_lock:
+        conn = _conns.get(collection)
+        if conn is not None:
+            return conn, _locks[collection]
+        path = _path(collection)
+        if not create and not os.path.exists(path):
+            return None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        for stmt in _SCHEMA:
+            conn.execute(stmt)
+        conn.commit()
+        _conns[collection] = conn
+        _locks[collection] = threading.Lock()
+        return conn, _locks[collection]
+
+
+def _rows_for_ids(conn: sqlite3.Connection, ids: Sequence[str]) -> List[int]:
+    rows: List[int] = []
+    for i in range(0, len(ids), 500):
+        part = list(ids[i:i + 500])
+        marks = ",".join("?" * len(part))
+        rows += [r for (r,) in conn.execute(f"SELECT row FROM chunk_rows WHERE chunk_id IN ({marks})", part)]
+    return rows
+
+
+def _delete_rows(conn: sqlite3.Connection, rows: Sequence[int]) -> None:
+    for i in range(0, len(rows), 500):
+        part = list(rows[i:i + 500])
+        marks = ",".join("?" * len(part))
+        conn.execute(f"DELETE FROM chunks WHERE rowid IN ({marks})", part)
+        conn.execute(f"DELETE FROM chunk_rows WHERE row IN ({marks})", part)
+
+
+def upsert_chunks(collection: str, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]]) -> None:
+    """Insert or replace chunks by id."""
+    if not settings.LEXICAL_INDEX_ENABLED or not ids:
+        return
+    conn, lock = _open(collection, create=True)
+    with lock:
+        _delete_rows(conn, _rows_for_ids(conn, ids))
+        for cid, text, meta in zip(ids, texts, metadatas):
+            cur = conn.execute(
+                "INSERT INTO chunks(tokens, text) VALUES (?, ?)", (" ".join(tokenize(text)), text)
+            )
+            conn.execute(
+                "INSERT INTO chunk_rows(chunk_id, row, doc_id, doc_uid, chunk_index, filename)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (cid, cur.lastrowid, meta.get("doc_id"), meta.get("doc_uid"),
+                 meta.get("chunk_index"), meta.get("filename")),
+            )
+        conn.commit()
+
+
+def delete_doc(collection: str, doc_uid: str, start: int = 0) -> None:
+    """Delete a document's chunks whose chunk_index is >= start."""
+    if not settings.LEXICAL_INDEX_ENABLED:
+        return
+    handle = _open(collection, create=False)
+    if handle is None:
+        return
+    conn, lock = handle
+    with lock:
+        rows = [
+            r for (r,) in conn.execute(
+                "SELECT row FROM chunk_rows WHERE doc_uid = ? AND chunk_index >= ?", (doc_uid, int(start))
+            )
+        ]
+        _delete_rows(conn, rows)
+        conn.commit()
+
+
+def drop_collection(collection: str) -> None:
+    """Close a collection's index and delete its database files."""
+    with _conns_lock:
+        conn = _conns.pop(collection, None)
+        lock = _locks.pop(collection, None)
+    if conn is not None:
+        with lock:  # let an in-flight write finish first
+            conn.close()
+    path = _path(collection)
+    removed = 0
+    for p in (path, path + "-wal", path + "-shm"):
+        try:
+            os.remove(p)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info("[lexical_index] dropped collection=%s files=%s", collection, removed)
+
+
+def search(kb_id: int, collection: str, query: str, n_results: int) -> List[Dict[str, Any]]:
+    """BM25 top-n for a query, shaped like the dense retrieval candidates."""
+    terms = list(dict.fromkeys(tokenize(query)))[:_MAX_QUERY_TERMS]
+    if not terms or n_results <= 0:
+        return []
+    handle = _open(collection, create=False)
+    if handle is None:
+        return []
+    conn, lock = handle
+    match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+    with lock:
+        rows = conn.execute(
+            "SELECT r.doc_id, r.doc_uid, r.chunk_index, r.filename, c.text, bm25(chunks) AS s"
+            " FROM chunks c JOIN chunk_rows r ON r.row = c.rowid"
+            " WHERE chunks MATCH ? ORDER BY s LIMIT ?",
+            (match, n_results),
+        ).fetchall()
+    return [
+        {
+            "text": text or "",
+            "kb_id": kb_id,
+            "doc_id": doc_id,
+            "doc_uid": doc_uid,
+            "chunk_index": chunk_index,
+            "filename": filename,
+            "bm25": -float(score),  # FTS5 reports lower-is-better
+        }
+        for doc_id, doc_uid, chunk_index, filename, text, score in rows
+    ]
+
+
+def rrf_fuse(ranked_lists: List[List[Dict[str, Any]]], k: int) -> List[Dict[str, Any]]:
+    """Reciprocal-rank fusion of candidate lists; the same chunk is merged across lists."""
+    fused: Dict[tuple, Dict[str, Any]] = {}
+    for ranked in ranked_lists:
+        for rank, cand in enumerate(ranked, 1):
+            key = (cand.get("kb_id"), cand.get("doc_uid"), cand.get("chunk_index"))
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = dict(cand)
+                entry["rrf"] = 0.0
+            else:
+                for field, value in cand.items():
+                    entry.setdefault(field, value)
+            entry["rrf"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda c: c["rrf"], reverse=True)
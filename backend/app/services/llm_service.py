@@ -2,11 +2,11 @@ from __future__ import annotations
 
 import time
 import logging
-from typing import Dict, Iterable, List, Optional
-
-import httpx
+from typing import AsyncIterator, Dict, List, Optional
 
+from app.config.logging_config import log_event
 from app.config.settings import settings
+from app.services.http_client import get_async_client, get_sync_client
 
 logger = logging.getLogger(__name__)
 
@@ -45,7 +45,7 @@ class LLMClient:
             payload["top_p"] = top_p
         if max_tokens is not None:
             payload["max_tokens"] = max_tokens
-        logger.info(
+        logger.debug(
             "[llm.chat_completion] request model=%s msgs=%s temperature=%s top_p=%s max_tokens=%s",
             payload.get("model"),
             len(messages),
@@ -55,37 +55,34 @@ class LLMClient:
         )
         t0 = time.time()
         try:
-            with httpx.Client(timeout=60.0) as client:
-                resp = client.post(url, json=payload, headers=self._headers())
-                resp.raise_for_status()
-                data = resp.json()
+            resp = get_sync_client().post(url, json=payload, headers=self._headers(), timeout=60.0)
+            resp.raise_for_status()
+            data = resp.json()
         except Exception:
             logger.exception("[llm.chat_completion] request_failed model=%s", payload.get("model"))
             raise
         finally:
             elapsed_ms = int((time.time() - t0) * 1000)
-            logger.info("[llm.chat_completion] elapsed_ms=%s", elapsed_ms)
+            logger.debug("[llm.chat_completion] elapsed_ms=%s", elapsed_ms)
 
         try:
             choices = (data.get("choices") or [])
             msg = (choices[0].get("message") or {}) if choices else {}
             content = msg.get("content") or ""
             usage = data.get("usage") or {}
-            logger.info(
+            logger.debug(
                 "[llm.chat_completion] status=%s out_len=%s prompt_tokens=%s completion_tokens=%s",
                 resp.status_code,
                 len(content),
                 usage.get("prompt_tokens"),
                 usage.get("completion_tokens"),
             )
-            if content:
-                logger.info("[llm.chat_completion] output_preview=%r", content[:200])
         except Exception:
             # best-effort logging; do not fail
             logger.debug("[llm.chat_completion] post_log_parse_failed")
         return data
 
-    def chat_completion_stream(
+    async def achat_completion_stream(
         self,
         messages: List[Dict[str, str]],
         model: Optional[str] = None,
@@ -93,14 +90,17 @@ class LLMClient:
         temperature: Optional[float] = None,
         top_p: Optional[float] = None,
         max_tokens: Optional[int] = None,
-    ):
-        """Streaming chat completion. Yields raw SSE lines (bytes/str)."""
+    ) -> AsyncIterator[str]:
+        """Async streaming chat completion over the shared AsyncClient. Yields raw SSE lines."""
         url = f"{self.base_url}/chat/completions"
         payload: Dict = {
             "model": model or settings.LLM_DEFAULT_MODEL,
             "messages": messages,
             "stream": True,
         }
+        if settings.LLM_STREAM_INCLUDE_USAGE:
+            # final frame carries `usage` (OpenAI-compatible providers)
+            payload["stream_options"] = {"include_usage": True}
         if temperature is not None:
             payload["temperature"] = temperature
         if top_p is not None:
@@ -108,20 +108,18 @@ class LLMClient:
         if max_tokens is not None:
             payload["max_tokens"] = max_tokens
 
-        logger.info("[llm.chat_completion_stream] starting stream model=%s", payload.get("model"))
-        with httpx.Client(timeout=None) as client:
-            with client.stream("POST", url, json=payload, headers=self._headers()) as r:
-                r.raise_for_status()
-                logger.info("[llm.chat_completion_stream] stream connected status=%s", r.status_code)
-                line_count = 0
-                for line in r.iter_lines():
-                    if not line:
-                        continue
-                    line_count += 1
-                    if line_count <= 5 or line_count % 10 == 0:  # 记录前5行和每10行
-                        logger.info("[llm.chat_completion_stream] line_%s: %r", line_count, line[:100])
-                    yield line
-                logger.info("[llm.chat_completion_stream] stream ended total_lines=%s", line_count)
-
+        logger.debug("[llm.achat_completion_stream] starting stream model=%s", payload.get("model"))
+        client = get_async_client()
+        async with client.stream("POST", url, json=payload, headers=self._headers(), timeout=None) as r:
+            r.raise_for_status()
+            logger.debug("[llm.achat_completion_stream] stream connected status=%s", r.status_code)
+            line_count = 0
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                line_count += 1
+                log_event(logger, "[llm.achat_completion_stream] recv_line", n=line_count, line=line[:100])
+                yield line
+            logger.debug("[llm.achat_completion_stream] stream ended total_lines=%s", line_count)
 
 llm_client = LLMClient()
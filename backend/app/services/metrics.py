@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Prometheus metrics for chat turns and ingestion. prometheus_client is optional: without
+# it (or with METRICS_ENABLED off) every helper here is a no-op and /metrics is not mounted.
+# With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates them.
+# Ingestion runs in the indexing worker (app.worker), which serves its own metrics on
+# WORKER_METRICS_PORT; scrape it alongside the API.
+
+try:
+    import prometheus_client as _prom
+except ImportError:  # pragma: no cover - optional dependency
+    _prom = None
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+enabled = bool(_prom is not None and settings.METRICS_ENABLED)
+
+if enabled:
+    CHAT_STAGE_SECONDS = _prom.Histogram(
+        "rag_chat_stage_seconds",
+        "Time spent per chat turn stage",
+        ["stage"],
+        buckets=_LATENCY_BUCKETS,
+    )
+    CHAT_TURNS = _prom.Counter(
+        "rag_chat_turns_total",
+        "Chat turns by mode and outcome",
+        ["mode", "outcome"],
+    )
+    RETRIEVAL_CANDIDATES = _prom.Histogram(
+        "rag_retrieval_candidates",
+        "Candidates per retrieval before and after rerank trimming",
+        ["phase"],
+        buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128),
+    )
+    INDEX_STAGE_SECONDS = _prom.Histogram(
+        "rag_index_stage_seconds",
+        "Time spent per document ingestion stage",
+        ["stage"],
+        buckets=_LATENCY_BUCKETS + (300.0, 900.0),
+    )
+    INDEX_DOCUMENTS = _prom.Counter(
+        "rag_index_documents_total",
+        "Indexed documents by outcome",
+        ["outcome"],
+    )
+    INDEX_CHUNKS = _prom.Counter(
+        "rag_index_chunks_total",
+        "Chunks processed during ingestion",
+        ["kind"],
+    )
+
+
+def observe_chat(stage: str, seconds: float) -> None:
+    if enabled:
+        CHAT_STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def observe_chat_ms(timings: Dict[str, int]) -> None:
+    """Record prepare_turn style timings ({"<stage>_ms": ms})."""
+    if not enabled:
+        return
+    for key, ms in timings.items():
+        if key.endswith("_ms") and ms is not None:
+            CHAT_STAGE_SECONDS.labels(key[:-3]).observe(ms / 1000.0)
+
+
+def count_turn(mode: str, outcome: str) -> None:
+    if enabled:
+        CHAT_TURNS.labels(mode, outcome).inc()
+
+
+def observe_candidates(phase: str, n: int) -> None:
+    if enabled:
+        RETRIEVAL_CANDIDATES.labels(phase).observe(n)
+
+
+def observe_index(stage: str, seconds: float) -> None:
+    if enabled:
+        INDEX_STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def count_index(outcome: str) -> None:
+    if enabled:
+        INDEX_DOCUMENTS.labels(outcome).inc()
+
+
+def count_chunks(kind: str, n: int) -> None:
+    if enabled and n:
+        INDEX_CHUNKS.labels(kind).inc(n)
+
+
+@contextmanager
+def chat_timer(stage: str) -> Iterator[None]:
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_chat(stage, time.perf_counter() - t)
+
+
+@contextmanager
+def index_timer(stage: str) -> Iterator[None]:
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_index(stage, time.perf_counter() - t)
+
+
+def start_http_server(port: int, tries: int = 1) -> Optional[int]:
+    """Serve this process's metrics on their own port (for processes without the API app).
+
+    Tries port, port+1, ... up to `tries` ports so several processes on one host each
+    get one. Returns the bound port, or None when disabled or every port is taken.
+    """
+    if not enabled or port <= 0:
+        return None
+    for p in range(port, port + max(1, tries)):
+        try:
+            _prom.start_http_server(p)
+        except OSError:
+            continue
+        logger.info("[metrics] http_server_started port=%s", p)
+        return p
+    logger.warning("[metrics] http_server_unavailable ports=%s-%s", port, port + max(1, tries) - 1)
+    return None
+
+
+def render() -> Optional[Tuple[bytes, str]]:
+    """Exposition payload and content type, or None when metrics are disabled."""
+    if not enabled:
+        return None
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = _prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = _prom.REGISTRY
+    return _prom.generate_latest(registry), _prom.CONTENT_TYPE_LATEST
@@ -1,49 +1,145 @@
 from __future__ import annotations
 
+import hashlib
 import logging
-from typing import List, Tuple
-
-import httpx
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 from app.config.settings import settings
+from app.services.http_client import get_sync_client
 
 logger = logging.getLogger(__name__)
 
 
-def rerank(query: str, documents: List[str], top_n: int | None = None, model: str | None = None) -> List[Tuple[str, float, int]]:
-    """Call SiliconFlow rerank API and return list of (document, score, original_index).
+class RerankScoreCache:
+    """Bounded in-process LRU of relevance scores keyed by (model, sha256(query), sha256(doc)).
 
-    The API expects inputs: { model, query, documents }. Returns list with indexes and scores.
+    Cross-encoder scores depend only on the (query, document) pair, so a repeated
+    question re-sending the same candidate list is served entirely from here, and a
+    partly changed list only sends the new documents to the API.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[tuple]) -> Dict[int, float]:
+        out: Dict[int, float] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._data.get(key)
+                if score is not None:
+                    self._data.move_to_end(key)
+                    out[i] = score
+            self.hits += len(out)
+            self.misses += len(keys) - len(out)
+        return out
+
+    def put_many(self, items: Dict[tuple, float]) -> None:
+        with self._lock:
+            for key, score in items.items():
+                self._data[key] = score
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+_cache: Optional[RerankScoreCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_score_cache() -> Optional[RerankScoreCache]:
+    """Return the process-wide rerank score cache, or None when disabled."""
+    global _cache
+    if settings.RERANK_CACHE_SIZE <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RerankScoreCache(settings.RERANK_CACHE_SIZE)
+    return _cache
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def _score(query: str, documents: List[str], model: str) -> List[Optional[float]]:
+    """Call SiliconFlow rerank API and return a relevance score per document, in input order.
+
+    Documents the response leaves out get None rather than a made-up score.
     """
-    if not documents:
-        return []
     api_key = settings.SILICONFLOW_API_KEY
     if not api_key:
         raise ValueError("SILICONFLOW_API_KEY not configured for rerank")
     url = "https://api.siliconflow.cn/v1/rerank"
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     payload = {
-        "model": model or settings.RERANK_MODEL,
+        "model": model,
         "query": query,
         "documents": documents,
     }
-    if top_n is not None:
-        payload["top_n"] = min(top_n, len(documents))
 
-    logger.info("[rerank] request model=%s docs=%s", payload["model"], len(documents))
-    with httpx.Client(timeout=120.0) as client:
-        resp = client.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
+    logger.info("[rerank] request model=%s docs=%s", model, len(documents))
+    resp = get_sync_client().post(url, json=payload, headers=headers, timeout=120.0)
+    resp.raise_for_status()
+    data = resp.json()
 
-    results = []
+    scores: List[Optional[float]] = [None] * len(documents)
     for item in data.get("results", []):
-        idx = int(item.get("index"))
-        score = float(item.get("relevance_score", 0.0))
-        results.append((documents[idx], score, idx))
+        if item.get("relevance_score") is not None:
+            scores[int(item["index"])] = float(item["relevance_score"])
+    missing = scores.count(None)
+    if missing:
+        logger.warning("[rerank] missing_scores model=%s docs=%s missing=%s", model, len(documents), missing)
+    return scores
+
+
+def rerank(query: str, documents: List[str], top_n: int | None = None, model: str | None = None) -> List[Tuple[str, float, int]]:
+    """Rerank documents for a query and return list of (document, score, original_index), best first.
+
+    Scores already in the score cache are reused; only the remaining distinct documents
+    are sent to the API.
+    """
+    if not documents:
+        return []
+    model_name = model or settings.RERANK_MODEL
+    cache = get_score_cache()
+    if cache is None:
+        scores = _score(query, documents, model_name)
+    else:
+        qh = _digest(query)
+        keys = [(model_name, qh, _digest(d)) for d in documents]
+        found = cache.get_many(keys)
+        pending: Dict[tuple, List[int]] = {}
+        for i, key in enumerate(keys):
+            if i not in found:
+                pending.setdefault(key, []).append(i)
+        if pending:
+            fresh = _score(query, [documents[idxs[0]] for idxs in pending.values()], model_name)
+            # only cache what the provider scored; a missing pair is retried next time
+            cache.put_many({key: score for key, score in zip(pending.keys(), fresh) if score is not None})
+            for idxs, score in zip(pending.values(), fresh):
+                for i in idxs:
+                    found[i] = score
+        logger.info(
+            "[rerank] cache model=%s docs=%s hits=%s scored=%s",
+            model_name, len(documents), len(documents) - sum(len(v) for v in pending.values()), len(pending),
+        )
+        scores = [found[i] for i in range(len(documents))]
+
+    # unscored documents rank last
+    results = [(documents[i], 0.0 if score is None else score, i) for i, score in enumerate(scores)]
     # Desc by score
     results.sort(key=lambda x: x[1], reverse=True)
     if top_n is not None:
         results = results[:top_n]
     return results
-
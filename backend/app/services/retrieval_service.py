@@ -1,14 +1,108 @@
 from __future__ import annotations
 
+import time
 import logging
-from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
 
-from app.services import chroma_client
-from app.services.embedding_service import embed_texts
+from app.config.settings import settings
+from app.services import chroma_client, lexical_index, metrics
+from app.services.embedding_service import embed_query
 from app.services.rerank_service import rerank as _rerank
+from app.services.token_budget import get_tokenizer
 
 logger = logging.getLogger(__name__)
 
+# Shared pool for per-collection Chroma queries; not used as a context manager so
+# a timed-out query never blocks the request that gave up on it.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.RAG_QUERY_MAX_WORKERS,
+    thread_name_prefix="chroma-query",
+)
+
+
+def _query_collection(kb_id: int, name: str, qvec: List[float], n_results: int) -> List[Dict[str, Any]]:
+    col = chroma_client.get_collection(name)
+    if col is None:
+        # nothing indexed into this KB yet
+        return []
+    try:
+        with metrics.chat_timer("chroma_query"):
+            resp = col.query(query_embeddings=[qvec], n_results=n_results, include=["documents", "metadatas", "distances"])
+    except Exception:
+        chroma_client.invalidate_collection(name)
+        raise
+    docs_list = (resp.get("documents") or [[]])[0]
+    metas_list = (resp.get("metadatas") or [[]])[0]
+    dists_list = (resp.get("distances") or [[]])[0]
+    out: List[Dict[str, Any]] = []
+    for doc_text, meta, dist in zip(docs_list, metas_list, dists_list):
+        if not isinstance(meta, dict):
+            meta = {}
+        out.append({
+            "text": doc_text or "",
+            "kb_id": kb_id,
+            "doc_id": meta.get("doc_id"),
+            "doc_uid": meta.get("doc_uid"),
+            "chunk_index": meta.get("chunk_index"),
+            "filename": meta.get("filename"),
+            "distance": float(dist) if dist is not None else None,
+        })
+    return out
+
+
+def _lexical_query(kb_id: int, name: str, query_text: str, n_results: int) -> List[Dict[str, Any]]:
+    with metrics.chat_timer("lexical_query"):
+        return lexical_index.search(kb_id, name, query_text, n_results)
+
+
+def _shingles(text: str, n: int = 5) -> set:
+    s = " ".join(text.lower().split())
+    return {s[i:i + n] for i in range(max(1, len(s) - n + 1))}
+
+
+def _dedup(candidates: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """Drop candidates whose text is (near-)identical to a better-ranked one."""
+    kept: List[Dict[str, Any]] = []
+    kept_shingles: List[set] = []
+    for cand in candidates:
+        sh = _shingles(cand.get("text") or "")
+        if any(len(sh & other) / (len(sh | other) or 1) >= threshold for other in kept_shingles):
+            continue
+        kept.append(cand)
+        kept_shingles.append(sh)
+    return kept
+
+
+def _top_separated(dense: List[Dict[str, Any]], candidates: List[Dict[str, Any]]) -> bool:
+    """True when the best dense hit leads the ranking and is clearly closer than the runner-up."""
+    gap = settings.RERANK_SKIP_GAP
+    if gap <= 0 or len(dense) < 2:
+        return False
+    key = lambda c: (c.get("kb_id"), c.get("doc_uid"), c.get("chunk_index"))  # noqa: E731
+    if key(dense[0]) != key(candidates[0]):
+        return False
+    d0, d1 = dense[0].get("distance"), dense[1].get("distance")
+    if d0 is None or d1 is None or d1 <= 0:
+        return False
+    return (d1 - d0) / d1 >= gap
+
+
+def _prepare_rerank(candidates: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Dedupe, cap by distance to the best dense hit and by count, and truncate texts
+    to the reranker's window. Returns (kept candidates, texts to send)."""
+    kept = _dedup(candidates, settings.RERANK_DEDUP_SIMILARITY)
+    distances = [c["distance"] for c in kept if c.get("distance") is not None]
+    ratio = settings.RERANK_DISTANCE_CAP_RATIO
+    if distances and ratio > 0:
+        cap = min(distances) * ratio + 1e-6
+        # lexical-only hits carry no distance and are kept for their exact matches
+        kept = [c for c in kept if c.get("distance") is None or c["distance"] <= cap]
+    kept = kept[:max(1, settings.RERANK_MAX_CANDIDATES)]
+    tok = get_tokenizer(settings.RERANK_MODEL)
+    texts = [tok.truncate(c.get("text") or "", settings.RERANK_MAX_TOKENS) for c in kept]
+    return kept, texts
+
 
 def retrieve_collections(
     *,
@@ -21,53 +115,70 @@ def retrieve_collections(
 ) -> List[Dict[str, Any]]:
     if not query_text or not collections:
         return []
-    qvec = embed_texts([query_text])[0]
-    candidates: List[Dict[str, Any]] = []
-
+    with metrics.chat_timer("query_embed"):
+        qvec = embed_query(query_text)
     per_k = per_kb_k or top_k
-    for c in collections:
-        kb_id = int(c.get("kb_id"))
-        name = c.get("collection")
-        if not name:
-            continue
+    targets = [(int(c.get("kb_id")), c.get("collection")) for c in collections if c.get("collection")]
+
+    # fan out per-KB queries; a slow or failing collection only drops its own hits
+    futures = [
+        (kb_id, name, "dense", _executor.submit(_query_collection, kb_id, name, qvec, per_k))
+        for kb_id, name in targets
+    ]
+    if settings.LEXICAL_INDEX_ENABLED:
+        futures += [
+            (kb_id, name, "lexical", _executor.submit(_lexical_query, kb_id, name, query_text, per_k))
+            for kb_id, name in targets
+        ]
+    deadline = time.monotonic() + settings.RAG_QUERY_TIMEOUT_SECONDS
+    dense: List[Dict[str, Any]] = []
+    lexical: List[Dict[str, Any]] = []
+    for kb_id, name, kind, fut in futures:
         try:
-            col = chroma_client.get_collection(name)
-            resp = col.query(query_embeddings=[qvec], n_results=per_k, include=["documents", "metadatas", "distances"])
-            docs_list = (resp.get("documents") or [[]])[0]
-            metas_list = (resp.get("metadatas") or [[]])[0]
-            dists_list = (resp.get("distances") or [[]])[0]
-            for doc_text, meta, dist in zip(docs_list, metas_list, dists_list):
-                if not isinstance(meta, dict):
-                    meta = {}
-                candidates.append({
-                    "text": doc_text or "",
-                    "kb_id": kb_id,
-                    "doc_id": meta.get("doc_id"),
-                    "doc_uid": meta.get("doc_uid"),
-                    "chunk_index": meta.get("chunk_index"),
-                    "filename": meta.get("filename"),
-                    "distance": float(dist) if dist is not None else None,
-                })
+            hits = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            fut.cancel()
+            logger.warning(
+                "[retrieval] query_timeout collection=%s kind=%s timeout_s=%s",
+                name,
+                kind,
+                settings.RAG_QUERY_TIMEOUT_SECONDS,
+            )
+            continue
         except Exception:
-            logger.exception("[retrieval] query_failed collection=%s", name)
+            logger.exception("[retrieval] query_failed collection=%s kind=%s", name, kind)
             continue
+        (dense if kind == "dense" else lexical).extend(hits)
 
+    dense.sort(key=lambda x: x.get("distance") or 0.0)
+    if lexical:
+        # hybrid: reciprocal-rank fusion of the dense and BM25 rankings
+        lexical.sort(key=lambda x: x["bm25"], reverse=True)
+        candidates = lexical_index.rrf_fuse([dense, lexical], k=settings.RAG_RRF_K)
+    else:
+        candidates = dense
     if not candidates:
         return []
+    metrics.observe_candidates("fused", len(candidates))
 
     # rerank optionally
     if use_rerank:
-        texts = [c["text"] for c in candidates]
-        reranked = _rerank(query_text, texts, top_n=(rerank_top_n or top_k))
+        if len(candidates) < 2 or _top_separated(dense, candidates):
+            logger.info("[retrieval] rerank_skipped candidates=%s", len(candidates))
+            return candidates[:top_k]
+        kept, texts = _prepare_rerank(candidates)
+        logger.info("[retrieval] rerank_trimmed candidates=%s kept=%s", len(candidates), len(kept))
+        metrics.observe_candidates("rerank", len(kept))
+        with metrics.chat_timer("rerank"):
+            reranked = _rerank(query_text, texts, top_n=(rerank_top_n or top_k))
         # map back by original index
         results: List[Dict[str, Any]] = []
         for _text, score, idx in reranked:
-            base = candidates[idx]
+            base = kept[idx]
             enriched = dict(base)
             enriched["score"] = float(score)
             results.append(enriched)
         return results[:top_k]
 
-    # no rerank: sort by distance asc
-    candidates.sort(key=lambda x: x.get("distance") or 0.0)
+    # no rerank: fused rank, or distance asc when there were no lexical hits
     return candidates[:top_k]
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import List
+from typing import Iterable, Iterator, List
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
@@ -10,3 +10,32 @@ def chunk_text(text: str, *, chunk_size: int = 1000, chunk_overlap: int = 200) -
     chunks = splitter.split_text(text or "")
     return chunks
 
+
+def iter_chunks(
+    sections: Iterable[str],
+    *,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    window_factor: int = 8,
+) -> Iterator[str]:
+    """Chunk a stream of sections (e.g. PDF pages) without joining the whole document.
+
+    Sections are joined with newlines into a rolling window of roughly
+    window_factor * chunk_size chars; every chunk but the last is emitted and the last
+    one is carried into the next window so chunks still flow across section boundaries.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    window = max(chunk_size, chunk_size * window_factor)
+    buf = ""
+    for section in sections:
+        buf = f"{buf}\n{section}" if buf else (section or "")
+        if len(buf) < window:
+            continue
+        chunks = splitter.split_text(buf)
+        if not chunks:
+            buf = ""
+            continue
+        yield from chunks[:-1]
+        buf = chunks[-1]
+    if buf:
+        yield from splitter.split_text(buf)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import os
+import re
+import math
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Local token counting for prompt assembly.
+#   get_tokenizer(model)  cached per model; a HuggingFace tokenizer.json under
+#                         LLM_TOKENIZER_DIR/<model>/ when present, otherwise a
+#                         CJK-aware estimate padded by LLM_TOKEN_ESTIMATE_MARGIN.
+#   context_window(model) prompt + completion window for the model.
+
+# Chat-format framing added per message by the provider (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# CJK ideographs, kana, hangul and full-width forms: roughly one token per character.
+_WIDE_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef]")
+
+
+class HeuristicTokenizer:
+    """Estimate: one token per wide character, one per 4 other characters, times a margin.
+
+    Not a bound: code, digits and rare scripts can tokenize denser than this, so
+    counts are scaled by LLM_TOKEN_ESTIMATE_MARGIN. Configure LLM_TOKENIZER_DIR
+    for exact counts.
+    """
+
+    name = "heuristic"
+
+    def __init__(self, margin: Optional[float] = None):
+        self.margin = max(1.0, settings.LLM_TOKEN_ESTIMATE_MARGIN if margin is None else margin)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        wide = len(_WIDE_RE.findall(text))
+        return math.ceil((wide + (len(text) - wide) / 4) * self.margin)
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        return [self.count(t) for t in texts]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        used = 0.0
+        for i, ch in enumerate(text):
+            used += (1.0 if _WIDE_RE.match(ch) else 0.25) * self.margin
+            if used > max_tokens:
+                return text[:i]
+        return text
+
+
+class HFTokenizer:
+    """Wraps a `tokenizers.Tokenizer` loaded from a local tokenizer.json."""
+
+    def __init__(self, name: str, path: str):
+        from tokenizers import Tokenizer
+
+        self.name = name
+        self._tok = Tokenizer.from_file(path)
+        self._tok.no_truncation()
+        self._tok.no_padding()
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self._tok.encode(text, add_special_tokens=False).ids)
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        if not texts:
+            return []
+        # encode_batch runs in the Rust thread pool
+        return [len(e.ids) for e in self._tok.encode_batch(list(texts), add_special_tokens=False)]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        enc = self._tok.encode(text, add_special_tokens=False)
+        if len(enc.ids) <= max_tokens:
+            return text
+        return text[:enc.offsets[max_tokens - 1][1]]
+
+
+_tokenizers: Dict[str, object] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def _tokenizer_path(model: str) -> Optional[str]:
+    root = settings.LLM_TOKENIZER_DIR
+    if not root:
+        return None
+    path = os.path.join(root, model, "tokenizer.json")
+    return path if os.path.isfile(path) else None
+
+
+def get_tokenizer(model: Optional[str] = None):
+    """Return the cached tokenizer for a model, falling back to the heuristic estimate."""
+    model_name = model or settings.LLM_DEFAULT_MODEL
+    tok = _tokenizers.get(model_name)
+    if tok is not None:
+        return tok
+    with _tokenizers_lock:
+        tok = _tokenizers.get(model_name)
+        if tok is None:
+            path = _tokenizer_path(model_name)
+            tok = HeuristicTokenizer()
+            if path:
+                try:
+                    tok = HFTokenizer(model_name, path)
+                except Exception:
+                    logger.warning("[token_budget] tokenizer_load_failed model=%s path=%s", model_name, path, exc_info=True)
+            logger.info("[token_budget] tokenizer model=%s kind=%s", model_name, tok.name)
+            _tokenizers[model_name] = tok
+    return tok
+
+
+def context_window(model: Optional[str] = None) -> int:
+    model_name = model or settings.LLM_DEFAULT_MODEL
+    return int(settings.LLM_CONTEXT_WINDOWS.get(model_name) or settings.LLM_CONTEXT_WINDOW)
+
+
+class _CountCache:
+    """Bounded LRU of token counts for immutable texts (e.g. stored messages by id)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[int]:
+        with self._lock:
+            n = self._data.get(key)
+            if n is not None:
+                self._data.move_to_end(key)
+            return n
+
+    def put(self, key: tuple, n: int) -> None:
+        with self._lock:
+            self._data[key] = n
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+_counts = _CountCache(max_size=50_000)
+
+
+def count_messages(tok, contents: Sequence[str], keys: Optional[Sequence[Optional[Hashable]]] = None) -> List[int]:
+    """Token cost of each chat message including per-message framing.
+
+    Messages with a key (e.g. their DB id) are counted once per tokenizer and cached;
+    the rest are counted in a single batch.
+    """
+    keys = keys or [None] * len(contents)
+    out: List[Optional[int]] = [None] * len(contents)
+    todo: List[int] = []
+    for i, key in enumerate(keys):
+        n = _counts.get((tok.name, key)) if key is not None else None
+        if n is None:
+            todo.append(i)
+        else:
+            out[i] = n
+    if todo:
+        for i, n in zip(todo, tok.count_many([contents[i] for i in todo])):
+            out[i] = n
+            if keys[i] is not None:
+                _counts.put((tok.name, keys[i]), n)
+    return [n + MESSAGE_OVERHEAD_TOKENS for n in out]  # type: ignore[operator]
@@ -0,0 +1,115 @@
+"""Standalone indexing worker.
+
+Run from backend/:  python -m app.worker
+
+Consumes the Redis indexing queue (app.services.index_queue) with bounded
+concurrency so parsing, chunking and embedding stay out of the API processes.
+"""
+from __future__ import annotations
+
+import logging
+import signal
+import threading
+
+from app.config.logging_config import setup_logging, shutdown_logging
+from app.config.mysql_config import SessionLocal
+from app.config.settings import settings
+from app.crud import crud_kb_document
+from app.services import index_queue, metrics
+from app.services.index_service import index_document
+
+logger = logging.getLogger("app.worker")
+
+_stop = threading.Event()
+_active: dict[str, dict] = {}
+_active_lock = threading.Lock()
+
+
+def _run_job(job: dict) -> None:
+    kb_id, doc_id, owner_id = job["kb_id"], job["doc_id"], job["owner_id"]
+    logger.info("[worker] job_start kb=%s doc=%s attempts=%s", kb_id, doc_id, job.get("attempts"))
+    ok = False
+    try:
+        with SessionLocal() as db:
+            ok = index_document(db, kb_id=kb_id, doc_id=doc_id, owner_id=owner_id)
+            if not ok and int(job.get("attempts") or 0) + 1 < settings.INDEX_QUEUE_MAX_ATTEMPTS:
+                # keep the document visible as in-flight while it waits for its retry
+                crud_kb_document.update_document_status(db, doc_id=doc_id, status="processing")
+    except Exception:
+        logger.exception("[worker] job_crashed kb=%s doc=%s", kb_id, doc_id)
+    if ok:
+        index_queue.ack(job)
+    else:
+        index_queue.retry(job)
+    logger.info("[worker] job_end kb=%s doc=%s ok=%s", kb_id, doc_id, ok)
+
+
+def _consume(slot: int) -> None:
+    while not _stop.is_set():
+        try:
+            job = index_queue.claim(timeout=settings.INDEX_QUEUE_POLL_SECONDS)
+        except Exception:
+            logger.exception("[worker] claim_failed slot=%s", slot)
+            _stop.wait(settings.INDEX_QUEUE_POLL_SECONDS)
+            continue
+        if job is None:
+            continue
+        with _active_lock:
+            _active[job["id"]] = job
+        try:
+            _run_job(job)
+        finally:
+            with _active_lock:
+                _active.pop(job["id"], None)
+
+
+def _housekeeping() -> None:
+    """Extend leases of running jobs and requeue jobs whose lease expired."""
+    interval = max(1.0, settings.INDEX_QUEUE_VISIBILITY_TIMEOUT / 3)
+    while not _stop.wait(interval):
+        try:
+            with _active_lock:
+                jobs = list(_active.values())
+            for job in jobs:
+                index_queue.extend(job)
+            index_queue.requeue_expired()
+        except Exception:
+            logger.exception("[worker] housekeeping_failed")
+
+
+def main() -> None:
+    setup_logging()
+    # parse/embed/upsert metrics are recorded here, not in the API process
+    metrics.start_http_server(settings.WORKER_METRICS_PORT, tries=settings.WORKER_METRICS_PORT_RANGE)
+
+    def _handle_signal(signum, _frame):
+        logger.info("[worker] stopping signal=%s", signum)
+        _stop.set()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+
+    index_queue.requeue_expired()
+    with SessionLocal() as db:
+        index_queue.recover_stuck(db)
+
+    concurrency = max(1, settings.INDEX_WORKER_CONCURRENCY)
+    threads = [threading.Thread(target=_housekeeping, name="index-housekeeping", daemon=True)]
+    threads += [
+        threading.Thread(target=_consume, args=(i,), name=f"index-worker-{i}", daemon=True)
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    logger.info("[worker] started concurrency=%s", concurrency)
+    while not _stop.is_set():
+        _stop.wait(1.0)
+    # let in-flight jobs finish their current document
+    for t in threads[1:]:
+        t.join()
+    logger.info("[worker] stopped")
+    shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import json
+
+from app.services.chat_service import _extract_piece, _stream_usage
+
+
+def _line(payload) -> str:
+    return "data: " + json.dumps(payload, ensure_ascii=False)
+
+
+def _delta(**delta):
+    return {"id": "c1", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+
+
+def test_fast_path_plain_text():
+    assert _extract_piece(_line(_delta(content="hello"))) == "hello"
+
+
+def test_fast_path_decodes_escapes():
+    line = "data: " + json.dumps(_delta(content='你好 "q"\n'))  # ensure_ascii: \u escapes
+    assert "\\u4f60" in line
+    assert _extract_piece(line) == '你好 "q"\n'
+
+
+def test_role_only_and_null_content():
+    assert _extract_piece(_line(_delta(role="assistant"))) is None
+    assert _extract_piece(_line(_delta(role="assistant", content=None))) is None
+    assert _extract_piece(_line(_delta(content=""))) is None
+
+
+def test_reordered_keys():
+    payload = {"choices": [{"delta": {"content": "x", "role": "assistant"}, "index": 0}], "id": "c1"}
+    assert _extract_piece(_line(payload)) == "x"
+
+
+def test_fallback_parses_data_line():
+    # content parts are not a string literal, so the fast path hands over to json.loads
+    line = _line(_delta(content=[{"type": "text", "text": "a"}, {"type": "text", "text": "b"}]))
+    assert _extract_piece(line) == "ab"
+
+
+def test_fallback_without_prefix():
+    payload = json.dumps({"choices": [{"message": {"content": [{"type": "text", "text": "m"}]}}]})
+    assert _extract_piece(payload) == "m"
+
+
+def test_tool_call_delta_has_no_text():
+    delta = _delta(tool_calls=[{"index": 0, "function": {"arguments": '{"content": "x"}'}}])
+    assert _extract_piece(_line(delta)) is None
+
+
+def test_stream_usage():
+    usage = {"prompt_tokens": 9, "completion_tokens": 2}
+    assert _stream_usage(_line({"choices": [], "usage": usage})) == usage
+    assert _stream_usage(_line(_delta(content="x") | {"usage": None})) == {}
+    assert _stream_usage(None) == {}
+    assert _stream_usage("data: {broken") == {}
+
+
+def _run_stream(monkeypatch, frames, delay_before=0.0):
+    """Drive astream_chat_generator against a fake provider; returns the persisted fields."""
+    import asyncio
+    from types import SimpleNamespace
+
+    import anyio
+
+    from app.services import chat_service
+
+    saved = {}
+
+    def persist(conversation_id, user_msg, **fields):
+        saved.update(fields)
+        return 1
+
+    monkeypatch.setattr(
+        chat_service, "_prepare_stream",
+        lambda *a, **k: (SimpleNamespace(id=1), [{"role": "user", "content": "q"}], {}, None),
+    )
+    monkeypatch.setattr(chat_service, "_persist_assistant", persist)
+
+    async def fake_stream(**kwargs):
+        for i, frame in enumerate(frames):
+            if i == 1:
+                await asyncio.sleep(delay_before)
+            yield frame
+
+    monkeypatch.setattr(chat_service.llm_client, "achat_completion_stream", fake_stream)
+
+    async def main():
+        return [x async for x in chat_service.astream_chat_generator(1, 1, "q")]
+
+    out = anyio.run(main)
+    return out, saved
+
+
+def test_stream_ttft_skips_role_only_frame(monkeypatch):
+    frames = [
+        _line(_delta(role="assistant", content="")),
+        _line(_delta(content="he")),
+        _line(_delta(content="llo")),
+        _line({"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2}}),
+        "data: [DONE]",
+    ]
+    out, saved = _run_stream(monkeypatch, frames, delay_before=0.05)
+    assert out[:4] == [f + "\n\n" for f in frames[:4]]
+    assert out[-1] == "data: [DONE]\n\n"
+    assert saved["content"] == "hello"
+    assert saved["ttft_ms"] >= 50
+    assert saved["tokens_prompt"] == 5 and saved["tokens_completion"] == 2
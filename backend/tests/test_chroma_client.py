@@ -0,0 +1,38 @@
+import uuid
+
+import chromadb
+import pytest
+
+from app.services import chroma_client
+
+
+@pytest.fixture
+def col(monkeypatch):
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(f"t_{uuid.uuid4().hex}")
+    monkeypatch.setattr(chroma_client, "get_collection", lambda name: collection)
+    return collection
+
+
+def _add(col, doc_uid, n):
+    ids = chroma_client.chunk_ids(doc_uid, n)
+    col.add(
+        ids=ids,
+        documents=[f"{doc_uid} {i}" for i in range(n)],
+        embeddings=[[float(i), 1.0] for i in range(n)],
+        metadatas=[{"doc_uid": doc_uid, "chunk_index": i} for i in range(n)],
+    )
+
+
+def test_delete_by_doc_uid_removes_every_chunk(col, monkeypatch):
+    monkeypatch.setattr(chroma_client.settings, "CHROMA_DELETE_BATCH_SIZE", 2)
+    _add(col, "doc-a", 5)
+    _add(col, "doc-b", 2)
+    assert chroma_client.delete_by_doc_uid("kb", "doc-a") == 5
+    assert sorted(col.get(include=[])["ids"]) == ["doc-b_0", "doc-b_1"]
+    assert chroma_client.delete_by_doc_uid("kb", "doc-a") == 0
+
+
+def test_delete_by_doc_uid_missing_collection(monkeypatch):
+    monkeypatch.setattr(chroma_client, "get_collection", lambda name: None)
+    assert chroma_client.delete_by_doc_uid("kb", "doc-a") == 0
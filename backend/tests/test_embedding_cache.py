@@ -0,0 +1,47 @@
+from app.services.embedding_cache import EmbeddingCache, QueryEmbeddingLRU, _DiskStore, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  What   is\tRAG?\n") == "What is RAG?"
+    # NFKC folds full-width forms and ideographic spaces
+    assert normalize_query("ＡＢＣ　１２３？") == "ABC 123?"
+    assert normalize_query("") == ""
+    assert normalize_query(None) == ""
+    # case is meaningful to the embedding model and is kept
+    assert normalize_query("Redis") != normalize_query("redis")
+
+
+def test_query_lru_evicts_oldest():
+    lru = QueryEmbeddingLRU(max_size=2, ttl=0)
+    lru.put("m", "a", [1.0])
+    lru.put("m", "b", [2.0])
+    assert lru.get("m", "a") == [1.0]  # a is now most recent
+    lru.put("m", "c", [3.0])
+    assert lru.get("m", "b") is None
+    assert lru.get("m", "a") == [1.0] and lru.get("m", "c") == [3.0]
+    assert lru.get("other", "a") is None
+    assert lru.evictions == 1
+
+
+def test_disk_cache_roundtrip(tmp_path):
+    cache = EmbeddingCache(_DiskStore(str(tmp_path / "emb.sqlite3"), ttl=0, max_entries=100))
+    cache.put_many("m", ["x", "y"], [[0.5, 1.5], [2.0, -1.0]])
+    found = cache.get_many("m", ["y", "z", "x", "y"])
+    assert found == {0: [2.0, -1.0], 2: [0.5, 1.5], 3: [2.0, -1.0]}
+    assert cache.get_many("other", ["x"]) == {}
+    assert cache.stats() == {"hits": 3, "misses": 2}
+
+
+def test_redis_cache_enforces_lru_bound():
+    import fakeredis
+
+    from app.services.embedding_cache import _RedisStore
+
+    client = fakeredis.FakeRedis()
+    cache = EmbeddingCache(_RedisStore(ttl=3600, max_entries=2, client=client))
+    cache.put_many("m", ["a", "b"], [[1.0], [2.0]])
+    assert cache.get_many("m", ["a"]) == {0: [1.0]}  # a is now most recent
+    cache.put_many("m", ["c"], [[3.0]])
+    assert cache.get_many("m", ["a", "b", "c"]) == {0: [1.0], 2: [3.0]}
+    assert client.zcard(_RedisStore.LRU_KEY) == 2
+    assert len(client.keys("emb:m:*")) == 2
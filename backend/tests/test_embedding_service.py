@@ -0,0 +1,56 @@
+import httpx
+import pytest
+
+from app.config.settings import settings
+from app.services import embedding_service
+
+
+class _Client:
+    """Fails with 503 a fixed number of times, then embeds every input as [len]."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.timeouts = []
+
+    def post(self, url, json, headers, timeout):
+        self.timeouts.append(timeout)
+        request = httpx.Request("POST", url)
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(503, request=request)
+        data = [{"index": i, "embedding": [float(len(t))]} for i, t in enumerate(json["input"])]
+        return httpx.Response(200, json={"data": data}, request=request)
+
+
+@pytest.fixture
+def embed_env(monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_BACKEND", "none")
+    monkeypatch.setattr(settings, "QUERY_EMBEDDING_CACHE_SIZE", 0)
+    monkeypatch.setattr(settings, "EMBEDDING_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "EMBEDDING_TIMEOUT_SECONDS", 60.0)
+    monkeypatch.setattr(settings, "EMBEDDING_QUERY_MAX_RETRIES", 1)
+    monkeypatch.setattr(settings, "EMBEDDING_QUERY_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "EMBEDDING_RETRY_BACKOFF", 0.0)
+
+    def use(client):
+        monkeypatch.setattr(embedding_service, "get_sync_client", lambda: client)
+        return client
+
+    return use
+
+
+def test_indexing_budget_retries(embed_env):
+    client = embed_env(_Client(failures=3))
+    assert embedding_service.embed_texts(["abc", "de"]) == [[3.0], [2.0]]
+    assert client.timeouts == [60.0] * 4
+
+
+def test_query_budget_fails_fast(embed_env):
+    client = embed_env(_Client(failures=1))
+    assert embedding_service.embed_query("hello") == [5.0]
+    assert client.timeouts == [5.0, 5.0]
+
+    client = embed_env(_Client(failures=2))
+    with pytest.raises(httpx.HTTPStatusError):
+        embedding_service.embed_query("hello")
+    assert client.timeouts == [5.0, 5.0]
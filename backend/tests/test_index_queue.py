@@ -0,0 +1,134 @@
+import json
+
+import fakeredis
+import pytest
+
+from app.config.settings import settings
+from app.services import index_queue as q
+
+
+@pytest.fixture
+def r(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(q, "get_redis_client", lambda: client)
+    monkeypatch.setattr(settings, "INDEX_QUEUE_VISIBILITY_TIMEOUT", 600)
+    monkeypatch.setattr(settings, "INDEX_QUEUE_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "INDEX_QUEUE_RETRY_DELAY_SECONDS", 60)
+    return client
+
+
+def _expire_all(r):
+    for raw in r.zrange(q.LEASES_KEY, 0, -1):
+        r.zadd(q.LEASES_KEY, {raw: 0})
+
+
+def _make_due(r):
+    for raw in r.zrange(q.DELAYED_KEY, 0, -1):
+        r.zadd(q.DELAYED_KEY, {raw: 0})
+
+
+def test_enqueue_skips_duplicates(r):
+    assert q.enqueue(1, 10, 7) is True
+    assert q.enqueue(1, 10, 7) is False
+    assert r.llen(q.QUEUE_KEY) == 1
+    assert q.tracked_doc_ids() == {10}
+
+
+def test_enqueue_is_all_or_nothing(r, monkeypatch):
+    # a failed transaction must not leave a pending marker without a job
+    def boom(self, *args, **kwargs):
+        raise RuntimeError("redis went away")
+
+    with monkeypatch.context() as m:
+        m.setattr(type(r.pipeline()), "execute", boom)
+        with pytest.raises(RuntimeError):
+            q.enqueue(1, 10, 7)
+    assert not r.sismember(q.PENDING_KEY, 10)
+    assert q.enqueue(1, 10, 7) is True
+
+
+def test_claim_leases_and_ack_clears(r):
+    q.enqueue(1, 10, 7)
+    job = q.claim(timeout=1)
+    assert (job["kb_id"], job["doc_id"], job["owner_id"], job["attempts"]) == (1, 10, 7, 0)
+    assert r.llen(q.QUEUE_KEY) == 0
+    assert r.lrange(q.PROCESSING_KEY, 0, -1) == [job["_raw"]]
+    assert r.zscore(q.LEASES_KEY, job["_raw"]) is not None
+    assert not r.sismember(q.PENDING_KEY, 10)
+    assert q.tracked_doc_ids() == {10}
+
+    q.ack(job)
+    assert r.llen(q.PROCESSING_KEY) == 0
+    assert r.zcard(q.LEASES_KEY) == 0
+    assert q.tracked_doc_ids() == set()
+
+
+def test_claim_timeout_returns_none(r):
+    assert q.claim(timeout=1) is None
+
+
+def test_retry_until_max_attempts(r):
+    q.enqueue(1, 10, 7)
+    for attempt in (1, 2):
+        job = q.claim(timeout=1)
+        assert q.retry(job) is True
+        assert r.llen(q.PROCESSING_KEY) == 0 and r.zcard(q.LEASES_KEY) == 0
+        _make_due(r)
+        assert q.promote_due() == 1
+        assert json.loads(r.lindex(q.QUEUE_KEY, 0))["attempts"] == attempt
+    job = q.claim(timeout=1)
+    assert q.retry(job) is False
+    assert r.llen(q.QUEUE_KEY) == 0 and r.llen(q.PROCESSING_KEY) == 0
+
+
+def test_retry_waits_out_backoff(r):
+    assert q.retry_delay(1) == 60 and q.retry_delay(2) == 120
+    q.enqueue(1, 10, 7)
+    assert q.retry(q.claim(timeout=1)) is True
+    # not due yet: nothing to claim, but the doc still counts as queued
+    assert q.claim(timeout=1) is None
+    assert r.zcard(q.DELAYED_KEY) == 1
+    assert q.tracked_doc_ids() == {10}
+    assert q.enqueue(1, 10, 7) is False
+
+    _make_due(r)
+    job = q.claim(timeout=1)
+    assert (job["doc_id"], job["attempts"]) == (10, 1)
+    assert r.zcard(q.DELAYED_KEY) == 0
+
+
+def test_requeue_expired_lease(r):
+    q.enqueue(1, 10, 7)
+    job = q.claim(timeout=1)
+    assert q.requeue_expired() == 0  # lease still valid
+
+    _expire_all(r)
+    assert q.requeue_expired() == 1
+    assert r.llen(q.PROCESSING_KEY) == 0
+    requeued = json.loads(r.lindex(q.QUEUE_KEY, 0))
+    assert requeued["doc_id"] == 10 and requeued["attempts"] == 1
+    # the dead worker's late ack must not disturb the requeued job
+    q.ack(job)
+    assert r.llen(q.QUEUE_KEY) == 1
+
+
+def test_orphan_without_lease_is_recovered(r):
+    q.enqueue(1, 10, 7)
+    # worker died between BRPOPLPUSH and leasing: in PROCESSING, no lease, pending marker kept
+    raw = r.brpoplpush(q.QUEUE_KEY, q.PROCESSING_KEY, timeout=1)
+    assert r.zscore(q.LEASES_KEY, raw) is None
+
+    assert q.requeue_expired() == 0  # leased now, not yet expired
+    assert r.zscore(q.LEASES_KEY, raw) is not None
+    assert not r.sismember(q.PENDING_KEY, 10)
+
+    _expire_all(r)
+    assert q.requeue_expired() == 1
+    assert json.loads(r.lindex(q.QUEUE_KEY, 0))["doc_id"] == 10
+    assert r.llen(q.PROCESSING_KEY) == 0
+
+
+def test_bad_job_is_dropped(r):
+    r.lpush(q.QUEUE_KEY, b"not json")
+    assert q.claim(timeout=1) is None
+    assert r.llen(q.PROCESSING_KEY) == 0
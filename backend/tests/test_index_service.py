@@ -0,0 +1,136 @@
+import json
+
+import chromadb
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config.database import Base
+from app.config.settings import settings
+from app.crud import crud_kb, crud_kb_document
+from app.services import answer_cache, chroma_client, index_service, lexical_index
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_ROOT", str(tmp_path))
+    monkeypatch.setattr(settings, "LEXICAL_INDEX_DIR", str(tmp_path / "lexical"))
+    monkeypatch.setattr(chroma_client, "_client", chromadb.EphemeralClient())
+    chroma_client.invalidate_collection()
+    monkeypatch.setattr(index_service, "embed_texts", lambda texts, model=None: [[float(len(t)), 1.0] for t in texts])
+    monkeypatch.setattr(answer_cache, "bump_kb_version", lambda kb_id: None)
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(models.User(id=1, uuid="u1", username="u", email="u@example.com", hashed_password="x"))
+    db.commit()
+    kb = crud_kb.create_kb(db, owner_id=1, name="kb")
+    path = tmp_path / "a.txt"
+    doc = crud_kb_document.create_document(db, kb.id, 1, filename="a.txt", storage_uri=str(path))
+    doc.ingest_params = json.dumps({"chunk_size": 40, "overlap": 5})
+    db.commit()
+    yield db, kb, doc, path
+    db.close()
+
+
+def _paragraphs(n):
+    return "\n\n".join(f"paragraph {i} " + "word " * 6 for i in range(n))
+
+
+def _chroma_indexes(kb, doc):
+    col = chroma_client.get_collection(kb.chroma_collection)
+    got = col.get(where={"doc_uid": doc.uid}, include=["metadatas"])
+    return sorted(m["chunk_index"] for m in got["metadatas"])
+
+
+def _lexical_indexes(kb, doc):
+    conn, _ = lexical_index._open(kb.chroma_collection, create=False)
+    rows = conn.execute("SELECT chunk_index FROM chunk_rows WHERE doc_uid = ?", (doc.uid,))
+    return sorted(r for (r,) in rows)
+
+
+def test_chunk_count_written_once_and_tail_removed(env, monkeypatch):
+    db, kb, doc, path = env
+    path.write_text(_paragraphs(8), encoding="utf-8")
+
+    calls = []
+    real_update = crud_kb_document.update_document_status
+
+    def spy(db, **kwargs):
+        calls.append(kwargs)
+        return real_update(db, **kwargs)
+
+    monkeypatch.setattr(crud_kb_document, "update_document_status", spy)
+
+    assert index_service.index_document(db, kb.id, doc.id, 1)
+    db.refresh(doc)
+    total = doc.chunk_count
+    assert total > 3 and doc.status == "processed"
+    assert [c for c in calls if "chunk_count" in c] == [calls[-1]]
+    assert _chroma_indexes(kb, doc) == list(range(total)) == _lexical_indexes(kb, doc)
+
+    # an interrupted run left chunks past the recorded chunk_count
+    extra = chroma_client.chunk_ids(doc.uid, 2, start=total)
+    metas = [{"doc_uid": doc.uid, "chunk_index": total + i} for i in range(2)]
+    chroma_client.upsert_texts(kb.chroma_collection, ids=extra, texts=["x", "y"], metadatas=metas,
+                               embeddings=[[1.0, 1.0], [2.0, 1.0]])
+    lexical_index.upsert_chunks(kb.chroma_collection, extra, ["x", "y"], metas)
+
+    path.write_text(_paragraphs(3), encoding="utf-8")
+    assert index_service.index_document(db, kb.id, doc.id, 1)
+    db.refresh(doc)
+    assert 0 < doc.chunk_count < total
+    assert _chroma_indexes(kb, doc) == list(range(doc.chunk_count)) == _lexical_indexes(kb, doc)
+
+
+def test_failed_run_keeps_previous_chunk_count(env, monkeypatch):
+    db, kb, doc, path = env
+    path.write_text(_paragraphs(4), encoding="utf-8")
+    assert index_service.index_document(db, kb.id, doc.id, 1)
+    db.refresh(doc)
+    before = doc.chunk_count
+
+    def fail(texts, model=None):
+        raise RuntimeError("embedding down")
+
+    path.write_text(_paragraphs(12), encoding="utf-8")
+    monkeypatch.setattr(index_service, "embed_texts", fail)
+    assert not index_service.index_document(db, kb.id, doc.id, 1)
+    db.refresh(doc)
+    assert doc.status == "failed" and doc.chunk_count == before
+
+
+def test_progress_written_per_batches_and_reset(env, monkeypatch):
+    db, kb, doc, path = env
+    path.write_text(_paragraphs(8), encoding="utf-8")
+    monkeypatch.setattr(settings, "INDEX_PIPELINE_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "INDEX_PROGRESS_EVERY_BATCHES", 2)
+
+    progress = []
+    real_update = crud_kb_document.update_document_status
+
+    def spy(db, **kwargs):
+        if "chunks_indexed" in kwargs and "status" not in kwargs:
+            progress.append(kwargs["chunks_indexed"])
+        return real_update(db, **kwargs)
+
+    monkeypatch.setattr(crud_kb_document, "update_document_status", spy)
+
+    assert index_service.index_document(db, kb.id, doc.id, 1)
+    db.refresh(doc)
+    total = doc.chunk_count
+    assert doc.chunks_indexed == total
+    # reset at start, then after every second batch of two chunks
+    batch_ends = [min(i + 2, total) for i in range(0, total, 2)]
+    assert progress == [0] + batch_ends[1::2]
+
+    def fail(texts, model=None):
+        raise RuntimeError("embedding down")
+
+    monkeypatch.setattr(index_service, "embed_texts", fail)
+    path.write_text(_paragraphs(9), encoding="utf-8")
+    assert not index_service.index_document(db, kb.id, doc.id, 1)
+    db.refresh(doc)
+    assert doc.chunks_indexed == 0 and doc.chunk_count == total
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.config.database import Base
+from app.config.settings import settings
+from app.crud import crud_kb
+from app.services import lexical_index
+
+
+@pytest.fixture
+def lexical_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LEXICAL_INDEX_ENABLED", True)
+    monkeypatch.setattr(settings, "LEXICAL_INDEX_DIR", str(tmp_path / "lexical"))
+    return tmp_path / "lexical"
+
+
+def _index(collection):
+    lexical_index.upsert_chunks(
+        collection,
+        ["u1:0", "u1:1"],
+        ["redis timeout error", "向量数据库 chroma"],
+        [{"doc_id": 1, "doc_uid": "u1", "chunk_index": i, "filename": "a.txt"} for i in range(2)],
+    )
+
+
+def test_drop_collection_closes_and_removes_files(lexical_dir):
+    _index("kb_x")
+    assert lexical_index.search(1, "kb_x", "redis", 5)
+    assert os.listdir(lexical_dir)
+
+    lexical_index.drop_collection("kb_x")
+    assert os.listdir(lexical_dir) == []
+    assert lexical_index.search(1, "kb_x", "redis", 5) == []
+    lexical_index.drop_collection("kb_x")  # idempotent
+
+
+def test_soft_delete_kb_drops_lexical_index(lexical_dir):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(models.User(id=1, uuid="u1", username="u", email="u@example.com", hashed_password="x"))
+    db.commit()
+    kb = crud_kb.create_kb(db, owner_id=1, name="kb")
+    other = crud_kb.create_kb(db, owner_id=1, name="other")
+    _index(kb.chroma_collection)
+    _index(other.chroma_collection)
+
+    crud_kb.soft_delete_kb(db, kb)
+    assert not os.path.exists(lexical_index._path(kb.chroma_collection))
+    assert lexical_index.search(other.id, other.chroma_collection, "chroma", 5)
+    lexical_index.drop_collection(other.chroma_collection)
+    db.close()
+
+
+def test_tokenize_words_and_cjk_bigrams():
+    assert lexical_index.tokenize("Redis ERR_TIMEOUT at v1.2.3 in /etc/app.conf") == [
+        "redis", "err_timeout", "at", "v1.2.3", "in", "etc/app.conf",
+    ]
+    assert lexical_index.tokenize("向量数据库") == ["向量", "量数", "数据", "据库"]
+    assert lexical_index.tokenize("用 chroma 库") == ["用", "chroma", "库"]
+    assert lexical_index.tokenize("") == [] and lexical_index.tokenize(None) == []
+
+
+def test_rrf_fuse_merges_same_chunk():
+    dense = [
+        {"kb_id": 1, "doc_uid": "a", "chunk_index": 0, "text": "A0", "distance": 0.1},
+        {"kb_id": 1, "doc_uid": "b", "chunk_index": 0, "text": "B0", "distance": 0.2},
+    ]
+    sparse = [
+        {"kb_id": 1, "doc_uid": "b", "chunk_index": 0, "text": "B0", "bm25": 3.0},
+        {"kb_id": 1, "doc_uid": "c", "chunk_index": 2, "text": "C2", "bm25": 1.0},
+    ]
+    fused = lexical_index.rrf_fuse([dense, sparse], k=60)
+    assert [c["doc_uid"] for c in fused] == ["b", "a", "c"]
+    assert fused[0]["rrf"] == 1 / 62 + 1 / 61
+    # fields from both lists survive the merge
+    assert fused[0]["distance"] == 0.2 and fused[0]["bm25"] == 3.0
+    assert lexical_index.rrf_fuse([], k=60) == []
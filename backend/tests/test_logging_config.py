@@ -0,0 +1,33 @@
+import logging
+
+from app.config import logging_config
+from app.config.logging_config import SamplingFilter, log_event
+
+
+def _capture(caplog):
+    caplog.set_level(logging.INFO, logger="app.test")
+    return logging.getLogger("app.test")
+
+
+def test_per_chunk_events_off_by_default(caplog):
+    logger = _capture(caplog)
+    log_event(logger, "[astream_chat] recv_chunk", conv=1, idx=0, bytes=10)
+    log_event(logger, "[chat] turn_summary", conv=1)
+    assert [r.event for r in caplog.records] == ["[chat] turn_summary"]
+
+
+def test_sample_rate_overrides_default(caplog, monkeypatch):
+    monkeypatch.setitem(logging_config._sample_rates, "[astream_chat] recv_chunk", 1.0)
+    logger = _capture(caplog)
+    log_event(logger, "[astream_chat] recv_chunk", conv=1, idx=0, bytes=10)
+    assert len(caplog.records) == 1
+    # already sampled: the handler filter must not drop it a second time
+    assert SamplingFilter({"[astream_chat] recv_chunk": 0.0}).filter(caplog.records[0])
+
+
+def test_filter_samples_plain_records():
+    f = SamplingFilter({"[x] noisy": 0.0})
+    rec = logging.makeLogRecord({"msg": "[x] noisy a=%s", "args": (1,), "levelno": logging.INFO})
+    assert not f.filter(rec)
+    rec.levelno = logging.WARNING
+    assert f.filter(rec)
@@ -0,0 +1,25 @@
+import socket
+
+import pytest
+
+from app.services import metrics
+
+
+@pytest.fixture
+def busy_port():
+    sock = socket.socket()
+    sock.bind(("", 0))
+    sock.listen()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.mark.skipif(not metrics.enabled, reason="prometheus_client not installed")
+def test_start_http_server_skips_busy_ports(busy_port):
+    assert metrics.start_http_server(busy_port) is None  # logged, not raised
+    port = metrics.start_http_server(busy_port, tries=20)
+    assert port is not None and busy_port < port < busy_port + 20
+
+
+def test_start_http_server_disabled():
+    assert metrics.start_http_server(0, tries=4) is None
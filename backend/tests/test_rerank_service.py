@@ -0,0 +1,51 @@
+import pytest
+
+from app.config.settings import settings
+from app.services import rerank_service
+
+
+class _Resp:
+    def __init__(self, results):
+        self._results = results
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"results": self._results}
+
+
+class _Client:
+    """Scores every document by length, except those listed in `drop`."""
+
+    def __init__(self, drop=()):
+        self.drop = set(drop)
+        self.requests = []
+
+    def post(self, url, json, headers, timeout):
+        self.requests.append(list(json["documents"]))
+        return _Resp([
+            {"index": i, "relevance_score": float(len(d))}
+            for i, d in enumerate(json["documents"]) if d not in self.drop
+        ])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "RERANK_CACHE_SIZE", 100)
+    monkeypatch.setattr(rerank_service, "_cache", None)
+    c = _Client(drop={"bb"})
+    monkeypatch.setattr(rerank_service, "get_sync_client", lambda: c)
+    return c
+
+
+def test_missing_scores_are_not_cached(client):
+    out = rerank_service.rerank("q", ["a", "bb", "ccc"], model="m")
+    assert [(d, s) for d, s, _ in out] == [("ccc", 3.0), ("a", 1.0), ("bb", 0.0)]
+    assert rerank_service.get_score_cache().stats()["size"] == 2
+
+    client.drop.clear()
+    out = rerank_service.rerank("q", ["a", "bb", "ccc"], model="m")
+    # only the previously unscored document goes back to the provider
+    assert client.requests[-1] == ["bb"]
+    assert [(d, s) for d, s, _ in out] == [("ccc", 3.0), ("bb", 2.0), ("a", 1.0)]
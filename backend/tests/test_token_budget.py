@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+from app.config.settings import settings
+from app.services import chat_service, token_budget
+from app.services.token_budget import MESSAGE_OVERHEAD_TOKENS, HeuristicTokenizer, count_messages
+
+
+def test_heuristic_applies_margin():
+    assert HeuristicTokenizer(margin=1.0).count("abcdefgh") == 2
+    assert HeuristicTokenizer(margin=1.0).count("你好") == 2
+    assert HeuristicTokenizer(margin=1.5).count("abcdefgh") == 3
+    assert HeuristicTokenizer(margin=0.5).count("abcdefgh") == 2  # never shrinks the estimate
+
+
+def test_heuristic_truncate_fits_budget():
+    tok = HeuristicTokenizer(margin=1.25)
+    text = "word " * 100 + "汉字" * 50
+    for n in (1, 10, 60):
+        assert tok.count(tok.truncate(text, n)) <= n
+    assert tok.truncate("short", 100) == "short"
+
+
+class _CountingTokenizer:
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+
+    def count_many(self, texts):
+        self.calls.append(list(texts))
+        return [len(t) for t in texts]
+
+
+def test_count_messages_adds_overhead_and_caches_keyed():
+    tok = _CountingTokenizer("test-count-messages")
+    assert count_messages(tok, ["abc", "de"], keys=[101, None]) == [3 + MESSAGE_OVERHEAD_TOKENS, 2 + MESSAGE_OVERHEAD_TOKENS]
+    assert count_messages(tok, ["abc", "de"], keys=[101, None]) == [3 + MESSAGE_OVERHEAD_TOKENS, 2 + MESSAGE_OVERHEAD_TOKENS]
+    # the keyed message is served from the cache; only the unkeyed one is recounted
+    assert tok.calls == [["abc", "de"], ["de"]]
+    assert count_messages(tok, []) == []
+
+
+def _msg(i, role, content):
+    return SimpleNamespace(id=i, role=role, content=content)
+
+
+def test_assemble_prompt_trims_whole_turns(monkeypatch):
+    tok = HeuristicTokenizer(margin=1.0)
+    monkeypatch.setattr(chat_service, "get_tokenizer", lambda model: tok)
+    monkeypatch.setattr(settings, "LLM_CONTEXT_RESERVE_TOKENS", 0)
+    history = [
+        _msg(9001, "user", "q" * 40),
+        _msg(9002, "assistant", "a" * 40),
+        _msg(9003, "user", "q" * 40),
+        _msg(9004, "assistant", "a" * 400),
+    ]
+    # each message costs 10 + overhead except the last reply (100 + overhead);
+    # one token short of the last whole turn leaves room for the reply alone
+    cost = lambda n: n + MESSAGE_OVERHEAD_TOKENS
+    budget = cost(1) + cost(10) + cost(100)
+    monkeypatch.setattr(token_budget.settings, "LLM_CONTEXT_WINDOWS", {"m": budget - 1})
+
+    msgs, stats = chat_service.assemble_prompt("m", history, "?", [], max_tokens=0)
+    assert stats["history_msgs"] == 0
+    assert [m["role"] for m in msgs] == ["user"]
+
+    monkeypatch.setattr(token_budget.settings, "LLM_CONTEXT_WINDOWS", {"m": budget + cost(10)})
+    msgs, stats = chat_service.assemble_prompt("m", history, "?", [], max_tokens=0)
+    assert stats["history_msgs"] == 2
+    assert [m["role"] for m in msgs] == ["user", "assistant", "user"]
+    assert msgs[1]["content"] == "a" * 400
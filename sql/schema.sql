@@ -53,6 +53,9 @@ CREATE TABLE IF NOT EXISTS messages (
     tokens_prompt INT NULL,
     tokens_completion INT NULL,
     latency_ms INT NULL,
+    ttft_ms INT NULL,
+    retrieval_ms INT NULL,
+    tokens_per_second FLOAT NULL,
     model VARCHAR(128) NULL,
     error TEXT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -103,6 +106,7 @@ CREATE TABLE IF NOT EXISTS knowledge_documents (
     mime_type VARCHAR(100) NULL,
     storage_uri VARCHAR(255) NULL,
     size_bytes BIGINT NULL,
+    content_sha256 VARCHAR(64) NULL,
     page_count INT NULL,
 
     status VARCHAR(16) NOT NULL DEFAULT 'uploaded', -- uploaded | processing | processed | failed
@@ -111,8 +115,10 @@ CREATE TABLE IF NOT EXISTS knowledge_documents (
 
     vector_source VARCHAR(255) NOT NULL,
     chunk_count INT NOT NULL DEFAULT 0,
+    chunks_indexed INT NOT NULL DEFAULT 0, -- progress of the current indexing run
     embedding_model VARCHAR(128) NULL,
     ingest_params TEXT NULL,
+    chunk_hashes MEDIUMTEXT NULL, -- JSON list of per-chunk content hashes
 
     uploaded_by INT NULL,
 
@@ -125,6 +131,7 @@ CREATE TABLE IF NOT EXISTS knowledge_documents (
     INDEX idx_kd_status (status),
     INDEX idx_kd_deleted_at (deleted_at),
     INDEX idx_kd_uploader (uploaded_by),
+    INDEX idx_kd_content_sha256 (content_sha256),
 
     CONSTRAINT fk_kd_kb FOREIGN KEY (kb_id) REFERENCES knowledge_bases(id),
     CONSTRAINT fk_kd_uploader FOREIGN KEY (uploaded_by) REFERENCES users(id)
@@ -152,3 +159,22 @@ CREATE TABLE IF NOT EXISTS kb_shared_users (
 -- Optional FK for conversation_kbs
 -- ALTER TABLE conversation_kbs
 --   ADD CONSTRAINT fk_convkbs_kb FOREIGN KEY (kb_id) REFERENCES knowledge_bases(id);
+
+-- Upgrade existing databases: per-chunk content hashes for incremental reindex
+-- ALTER TABLE knowledge_documents
+--   ADD COLUMN chunk_hashes MEDIUMTEXT NULL AFTER ingest_params;
+
+-- Upgrade existing databases: indexing progress
+-- ALTER TABLE knowledge_documents
+--   ADD COLUMN chunks_indexed INT NOT NULL DEFAULT 0 AFTER chunk_count;
+
+-- Upgrade existing databases: upload content hash for duplicate-file detection
+-- ALTER TABLE knowledge_documents
+--   ADD COLUMN content_sha256 VARCHAR(64) NULL AFTER size_bytes,
+--   ADD INDEX idx_kd_content_sha256 (content_sha256);
+
+-- Upgrade existing databases: per-message latency breakdown and throughput
+-- ALTER TABLE messages
+--   ADD COLUMN ttft_ms INT NULL AFTER latency_ms,
+--   ADD COLUMN retrieval_ms INT NULL AFTER ttft_ms,
+--   ADD COLUMN tokens_per_second FLOAT NULL AFTER retrieval_ms;